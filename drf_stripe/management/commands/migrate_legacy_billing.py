@@ -1,14 +1,31 @@
+import io
+from itertools import islice
+
 from django.core.management.base import BaseCommand
 from django.apps import apps as django_apps
 from django.contrib.contenttypes.models import ContentType
-from drf_stripe.models import StripeUser, Subscription
+from django.db import connection
+from django.db.transaction import atomic
+from django.db.models import UniqueConstraint
+from drf_stripe.models import StripeUser, Subscription, get_drf_stripe_user_model
 from drf_stripe.settings import drf_stripe_settings
 
+BATCH_SIZE = 1000
+CHUNK_SIZE = 2000
+PROGRESS_INTERVAL = 10000
+
 
 class Command(BaseCommand):
     """Create BillingAccount entries for existing StripeUser records and attach existing Subscriptions. Only runs if BILLING_ACCOUNT_MODEL is configured."""
     help = "Create BillingAccount entries for existing StripeUser records and attach existing Subscriptions. Only runs if BILLING_ACCOUNT_MODEL is configured."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--use-copy", action="store_true", default=False,
+            help="Insert BillingAccounts with PostgreSQL COPY instead of bulk_create, for very large user tables. "
+                 "Other BillingModel columns must be nullable or have database defaults."
+        )
+
     def handle(self, *args, **options):
         BillingModelPath = drf_stripe_settings.BILLING_ACCOUNT_MODEL
         if not BillingModelPath:
@@ -21,31 +38,209 @@ class Command(BaseCommand):
             self.stdout.write(self.style.ERROR(f"Cannot resolve BillingModel '{BillingModelPath}': {e}"))
             return
 
-        users = StripeUser.objects.all()
-        for su in users:
-            user = su.user
+        # Only BillingModels using a Generic relation (content_type/object_id) can be migrated automatically.
+        if not hasattr(BillingModel, 'content_type'):
+            self.stdout.write(self.style.WARNING(f"BillingModel {BillingModelPath} does not use content_type/object_id; manual migration required."))
+            return
+
+        # Resolve both ContentTypes in a single query, outside of any per-row loop.
+        UserModel = get_drf_stripe_user_model()
+        content_types = ContentType.objects.get_for_models(UserModel, BillingModel)
+        ct_user = content_types[UserModel]
+        ct_billing = content_types[BillingModel]
+
+        use_copy = options["use_copy"]
+        if use_copy and connection.vendor != "postgresql":
+            self.stdout.write(self.style.WARNING("--use-copy is only supported on PostgreSQL, using bulk_create."))
+            use_copy = False
+        upsert = not use_copy and _supports_owner_upsert(BillingModel)
+
+        # object_id is often a CharField or UUIDField on Generic relations, so user ids and stored object ids
+        # are both normalised with the field's to_python() before being compared.
+        to_object_id = BillingModel._meta.get_field("object_id").to_python
+
+        # Stream StripeUsers and write their BillingAccounts one chunk at a time, so memory stays bounded
+        # by CHUNK_SIZE; only user_id/customer_id are needed, so no join to user.
+        created_count = existing_count = filled_count = 0
+        # COPY reports the rows it writes, but rows skipped by ignore_conflicts are not reported by bulk_create,
+        # so without COPY the table is counted around the inserts.
+        billing_account_count = None if use_copy else BillingModel.objects.count()
+        stripe_users = StripeUser.objects.only("user_id", "customer_id").order_by("pk").iterator(chunk_size=CHUNK_SIZE)
+        for stripe_user_chunk in _chunks(stripe_users, CHUNK_SIZE):
+            try:
+                with atomic():
+                    chunk_created_count, chunk_existing_count, chunk_filled_count = self._migrate_stripe_users(
+                        BillingModel, ct_user, to_object_id, stripe_user_chunk, use_copy, upsert
+                    )
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(
+                    f"Failed migrating users {stripe_user_chunk[0].user_id} to {stripe_user_chunk[-1].user_id}: {e}"
+                ))
+                continue
+            created_count += chunk_created_count
+            existing_count += chunk_existing_count
+            filled_count += chunk_filled_count
+
+        if billing_account_count is not None:
+            created_count = BillingModel.objects.count() - billing_account_count
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created_count} BillingAccount(s), {existing_count} already existed, "
+            f"{filled_count} updated with a Stripe customer id."
+        ))
+
+        # Move subscriptions that link to stripe_user to use billing account's generic reference fields,
+        # one chunk at a time
+        verbosity = options["verbosity"]
+        moved_count = 0
+        processed_count = 0
+        subscriptions = Subscription.objects.filter(stripe_user__isnull=False).only("subscription_id", "stripe_user_id")
+        for subscription_chunk in _chunks(subscriptions.order_by("pk").iterator(chunk_size=CHUNK_SIZE), CHUNK_SIZE):
+            # pks are not returned by bulk_create(ignore_conflicts=True), so resolve them in one query per chunk.
+            billing_account_ids = {
+                to_object_id(object_id): pk for object_id, pk in BillingModel.objects.filter(
+                    content_type=ct_user, object_id__in={to_object_id(sub.stripe_user_id) for sub in subscription_chunk}
+                ).values_list("object_id", "pk")
+            }
+            subs = []
+            for sub in subscription_chunk:
+                processed_count += 1
+                if processed_count % PROGRESS_INTERVAL == 0:
+                    self.stdout.write(f"{processed_count} Subscription(s) processed...")
+                billing_account_id = billing_account_ids.get(to_object_id(sub.stripe_user_id))
+                if billing_account_id is None:
+                    continue
+                sub.billing_account_content_type = ct_billing
+                sub.billing_account_object_id = billing_account_id
+                subs.append(sub)
+                if verbosity >= 2:
+                    self.stdout.write(f"Moving Subscription {sub.subscription_id} to BillingAccount {billing_account_id}")
+
             try:
-                ct = ContentType.objects.get_for_model(user.__class__)
-                # If BillingModel uses Generic relation (most common when based on AbstractBillingAccount),
-                # create using content_type/object_id
-                billing_account, created = BillingModel.objects.get_or_create(
-                    content_type=ct,
-                    object_id=user.pk,
-                    defaults={"stripe_customer_id": su.customer_id}
+                Subscription.objects.bulk_update(
+                    subs, ["billing_account_content_type", "billing_account_object_id"], batch_size=BATCH_SIZE
                 )
-                if created:
-                    self.stdout.write(self.style.SUCCESS(f"Created BillingAccount {billing_account.pk} for user {user.pk}"))
-                else:
-                    self.stdout.write(f"Existing BillingAccount {billing_account.pk} for user {user.pk}")
-
-                # Move subscriptions that link to stripe_user to use billing account's generic reference fields if applicable
-                for sub in Subscription.objects.filter(stripe_user=su):
-                    if hasattr(BillingModel, 'content_type'):
-                        sub.billing_account_content_type = ContentType.objects.get_for_model(BillingModel)
-                        sub.billing_account_object_id = billing_account.pk
-                        sub.save(update_fields=["billing_account_content_type", "billing_account_object_id"])
-                        self.stdout.write(f"Moved Subscription {sub.subscription_id} to BillingAccount {billing_account.pk}")
-                    else:
-                        self.stdout.write(self.style.WARNING(f"BillingModel {BillingModelPath} does not use content_type/object_id; manual migration required for subscription {sub.subscription_id}"))
             except Exception as e:
-                self.stdout.write(self.style.ERROR(f"Failed migrating user {user.pk}: {e}"))
+                self.stdout.write(self.style.ERROR(
+                    f"Failed moving Subscriptions {subscription_chunk[0].subscription_id} to "
+                    f"{subscription_chunk[-1].subscription_id}: {e}"
+                ))
+                continue
+            moved_count += len(subs)
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved_count} Subscription(s) to BillingAccounts."))
+
+    def _migrate_stripe_users(self, BillingModel, ct_user, to_object_id, stripe_users, use_copy, upsert):
+        """
+        Create the missing BillingAccounts of a chunk of StripeUsers, and fill the customer id of the existing ones.
+        Returns the number of BillingAccounts written with COPY (0 without COPY), existing and filled.
+        """
+        existing = {
+            to_object_id(ba.object_id): ba for ba in BillingModel.objects.filter(
+                content_type=ct_user, object_id__in=[to_object_id(su.user_id) for su in stripe_users]
+            ).only("pk", "content_type_id", "object_id", "stripe_customer_id")
+        }
+        new_rows = []
+        # Existing BillingAccounts without a customer id take the one recorded on their StripeUser.
+        to_fill = []
+        for su in stripe_users:
+            object_id = to_object_id(su.user_id)
+            billing_account = existing.get(object_id)
+            if billing_account is None:
+                new_rows.append((ct_user.pk, object_id, su.customer_id))
+            elif not billing_account.stripe_customer_id and su.customer_id:
+                billing_account.stripe_customer_id = su.customer_id
+                to_fill.append(billing_account)
+
+        copied_count = self._write_billing_accounts(BillingModel, new_rows, to_fill, use_copy, upsert)
+        return copied_count, len(existing), len(to_fill)
+
+    def _write_billing_accounts(self, BillingModel, new_rows, to_fill, use_copy, upsert):
+        """
+        Insert BillingAccounts for new (content_type_id, object_id, stripe_customer_id) rows and save the
+        customer id of the to_fill BillingAccounts. Returns the number of rows written with COPY, 0 without COPY.
+        """
+        if use_copy:
+            BillingModel.objects.bulk_update(to_fill, ["stripe_customer_id"], batch_size=BATCH_SIZE)
+            return self._copy_billing_accounts(BillingModel, new_rows)
+
+        to_create = [
+            BillingModel(content_type_id=content_type_id, object_id=object_id, stripe_customer_id=customer_id)
+            for content_type_id, object_id, customer_id in new_rows
+        ]
+        if upsert:
+            # Single INSERT ... ON CONFLICT DO UPDATE for both new and to-be-filled accounts.
+            to_create.extend(
+                BillingModel(content_type_id=ba.content_type_id, object_id=ba.object_id, stripe_customer_id=ba.stripe_customer_id)
+                for ba in to_fill
+            )
+            BillingModel.objects.bulk_create(
+                to_create, batch_size=BATCH_SIZE, update_conflicts=True,
+                unique_fields=["content_type", "object_id"], update_fields=["stripe_customer_id"]
+            )
+        else:
+            BillingModel.objects.bulk_create(to_create, batch_size=BATCH_SIZE, ignore_conflicts=True)
+            BillingModel.objects.bulk_update(to_fill, ["stripe_customer_id"], batch_size=BATCH_SIZE)
+        return 0
+
+    @staticmethod
+    def _copy_billing_accounts(BillingModel, rows):
+        """
+        Stream (content_type_id, object_id, stripe_customer_id) rows into the BillingModel table
+        with PostgreSQL COPY, bypassing model instantiation. Returns the number of rows written.
+        """
+        opts = BillingModel._meta
+        quote_name = connection.ops.quote_name
+        columns = ", ".join(
+            quote_name(opts.get_field(name).column) for name in ("content_type", "object_id", "stripe_customer_id")
+        )
+        sql = f"COPY {quote_name(opts.db_table)} ({columns}) FROM STDIN"
+
+        count = 0
+        with connection.cursor() as cursor:
+            raw_cursor = cursor.cursor
+            if hasattr(raw_cursor, "copy"):
+                # psycopg 3
+                with raw_cursor.copy(sql) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                        count += 1
+            else:
+                # psycopg2
+                buffer = io.StringIO()
+                for row in rows:
+                    buffer.write("\t".join(_copy_text_value(value) for value in row) + "\n")
+                    count += 1
+                buffer.seek(0)
+                raw_cursor.copy_expert(sql, buffer)
+        return count
+
+
+def _chunks(iterable, size):
+    """Yield lists of up to size items from iterable."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _supports_owner_upsert(BillingModel):
+    """
+    Returns True if BillingModel declares a unique constraint on (content_type, object_id) and the database
+    supports bulk_create(update_conflicts=True) targeting it.
+    """
+    if not getattr(connection.features, "supports_update_conflicts_with_target", False):
+        return False
+    owner_fields = {"content_type", "object_id"}
+    opts = BillingModel._meta
+    if any(set(fields) == owner_fields for fields in opts.unique_together):
+        return True
+    return any(
+        isinstance(constraint, UniqueConstraint) and constraint.condition is None and set(constraint.fields) == owner_fields
+        for constraint in opts.constraints
+    )
+
+
+def _copy_text_value(value):
+    """Format a value for COPY text format."""
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
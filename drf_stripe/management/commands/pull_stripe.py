@@ -6,6 +6,6 @@ class Command(BaseCommand):
     help = "Pull data from Stripe and update database."
 
     def handle(self, *args, **kwargs):
-        call_command("update_stripe_products")
-        call_command("update_stripe_customers")
-        call_command("update_stripe_subscriptions")
+        call_command("update_stripe_products", stdout=self.stdout)
+        call_command("update_stripe_customers", all_pages=True, stdout=self.stdout)
+        call_command("update_stripe_subscriptions", all_pages=True, stdout=self.stdout)
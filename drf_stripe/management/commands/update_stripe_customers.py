@@ -9,6 +9,11 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("-l", "--limit", type=int, help="Limit", default=100)
         parser.add_argument("-s", "--starting_after", type=str, help="Starting after customer id", default=None)
+        parser.add_argument("-a", "--all", action="store_true", dest="all_pages",
+                            help="Retrieve all customers, using limit as the page size")
 
     def handle(self, *args, **kwargs):
-        stripe_api_update_customers(limit=kwargs.get('limit'), starting_after=kwargs.get('starting_after'))
+        user_creation_count, stripe_user_creation_count = stripe_api_update_customers(
+            limit=kwargs.get('limit'), starting_after=kwargs.get('starting_after'), all_pages=kwargs.get('all_pages'))
+        self.stdout.write(f"{user_creation_count} user(s) created, "
+                          f"{stripe_user_creation_count} user(s) linked to Stripe customers.")
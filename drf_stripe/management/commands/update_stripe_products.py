@@ -10,4 +10,6 @@ class Command(BaseCommand):
         pass
 
     def handle(self, *args, **kwargs):
-        stripe_api_update_products_prices()
+        product_creation_count, price_creation_count = stripe_api_update_products_prices()
+        self.stdout.write(f"Created {product_creation_count} new Products")
+        self.stdout.write(f"Created {price_creation_count} new Prices")
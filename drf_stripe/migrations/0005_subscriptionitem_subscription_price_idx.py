@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-15 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_stripe', '0004_subscription_billing_account'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscriptionitem',
+            index=models.Index(fields=['subscription', 'price'], name='drf_stripe__subscri_6ae169_idx'),
+        ),
+    ]
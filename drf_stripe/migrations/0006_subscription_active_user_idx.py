@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-15 21:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_stripe', '0005_subscriptionitem_subscription_price_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(condition=models.Q(('status__in', ['active', 'past_due', 'trialing'])), fields=['stripe_user', 'status'], name='drf_stripe_sub_active_user_idx'),
+        ),
+    ]
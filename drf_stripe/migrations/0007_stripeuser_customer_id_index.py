@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-15 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('drf_stripe', '0006_subscription_active_user_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stripeuser',
+            name='customer_id',
+            field=models.CharField(db_index=True, max_length=128, null=True),
+        ),
+    ]
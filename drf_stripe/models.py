@@ -1,3 +1,4 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
 from django.db import models
 from django.apps import apps as django_apps
@@ -32,7 +33,7 @@ class StripeUser(models.Model):
         related_name='stripe_user',
         primary_key=True
     )
-    customer_id = models.CharField(max_length=128, null=True)
+    customer_id = models.CharField(max_length=128, null=True, db_index=True)
 
     @property
     def subscription_items(self):
@@ -47,14 +48,18 @@ class StripeUser(models.Model):
     @property
     def subscribed_products(self):
         """Products the StripeUser currently has access to."""
-        return {item.price.product for item in self.current_subscription_items.prefetch_related("price", "price__product")}
+        products = Product.objects.filter(
+            prices__in=self.current_subscription_items.values('price')
+        ).distinct()
+        return set(products)
 
     @property
     def subscribed_features(self):
         """Features the StripeUser currently has access to."""
-        price_list = self.current_subscription_items.values_list('price', flat=True)
-        product_list = Price.objects.filter(pk__in=price_list).values_list("product", flat=True)
-        return {item.feature for item in ProductFeature.objects.filter(product_id__in=product_list).prefetch_related("feature")}
+        features = Feature.objects.filter(
+            linked_products__product__prices__in=self.current_subscription_items.values('price')
+        ).only("feature_id", "description").distinct()
+        return set(features)
 
     class Meta:
         indexes = [
@@ -100,7 +105,7 @@ class Price(models.Model):
 
 class AbstractBillingAccount(models.Model):
     """Abstract billing account to extend in the project for multi-user/group billing flows."""
-    stripe_customer_id = models.CharField(max_length=256, null=True, blank=True)
+    stripe_customer_id = models.CharField(max_length=256, null=True, blank=True, db_index=True)
     stripe_subscription_id = models.CharField(max_length=256, null=True, blank=True)
     manager_user = models.ForeignKey(
         get_drf_stripe_user_model_name(),
@@ -127,6 +132,19 @@ class AbstractBillingAccount(models.Model):
         self.save(update_fields=["stripe_customer_id"])
         return self.stripe_customer_id
 
+    async def aget_or_create_stripe_customer(self, stripe_module, **kwargs):
+        """
+        Async variant of get_or_create_stripe_customer(), releasing the worker during the Stripe API call.
+        Requires a stripe library version providing Customer.create_async.
+        """
+        if self.stripe_customer_id:
+            return self.stripe_customer_id
+        metadata = kwargs.pop("metadata", {}) or {}
+        customer = await stripe_module.Customer.create_async(metadata=metadata, **kwargs)
+        self.stripe_customer_id = customer["id"]
+        await sync_to_async(self.save)(update_fields=["stripe_customer_id"])
+        return self.stripe_customer_id
+
     def can_manage_billing(self, user):
         """Return True if the provided user is allowed to perform payment actions for this account."""
         if self.manager_user is None:
@@ -140,6 +158,9 @@ class Subscription(models.Model):
     stripe_user = models.ForeignKey(StripeUser, on_delete=models.CASCADE, related_name="subscriptions", null=True, blank=True)
     billing_account_content_type = models.ForeignKey(ContentType, null=True, blank=True, on_delete=models.CASCADE, related_name='+')
     billing_account_object_id = models.PositiveIntegerField(null=True, blank=True)
+    # The billing account linked to this subscription, if any. Cached once read; use
+    # prefetch_related("billing_account") to resolve many with one query per billing model.
+    billing_account = GenericForeignKey('billing_account_content_type', 'billing_account_object_id')
 
     period_start = models.DateTimeField(null=True, blank=True)
     period_end = models.DateTimeField(null=True, blank=True)
@@ -153,21 +174,21 @@ class Subscription(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['stripe_user', 'status']),
-            models.Index(fields=['billing_account_content_type', 'billing_account_object_id', 'status'])
+            models.Index(fields=['billing_account_content_type', 'billing_account_object_id', 'status']),
+            # Partial index on the rows that grant access (PostgreSQL, SQLite), used by current subscription lookups.
+            models.Index(
+                fields=['stripe_user', 'status'],
+                condition=models.Q(status__in=[status.value for status in ACCESS_GRANTING_STATUSES]),
+                name='drf_stripe_sub_active_user_idx'
+            )
         ]
 
-    @property
-    def billing_account(self):
-        """Return the billing account object linked to this subscription, if any."""
-        if self.billing_account_content_type_id and self.billing_account_object_id:
-            return self.billing_account_content_type.get_object_for_this_type(pk=self.billing_account_object_id)
-        return None
-
     def get_owner(self):
         """Return the owning object: billing account if present, else the legacy user."""
-        if self.billing_account:
-            return self.billing_account
-        if self.stripe_user:
+        billing_account = self.billing_account
+        if billing_account is not None:
+            return billing_account
+        if self.stripe_user_id is not None:
             return self.stripe_user.user
         return None
 
@@ -178,3 +199,8 @@ class SubscriptionItem(models.Model):
     subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, related_name="items")
     price = models.ForeignKey(Price, on_delete=models.CASCADE, related_name="+")
     quantity = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subscription', 'price'])
+        ]
@@ -1,16 +1,42 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from stripe.error import StripeError
 
-from drf_stripe.models import SubscriptionItem, Product, Price, Subscription, StripeUser
+from drf_stripe.models import SubscriptionItem, Product, Price, Subscription, StripeUser, ProductFeature
+from drf_stripe.stripe_api.api import stripe_api as stripe
 from drf_stripe.stripe_api.checkout import stripe_api_create_checkout_session
-from drf_stripe.stripe_api.customers import get_or_create_stripe_user
+from drf_stripe.stripe_api.customers import get_or_create_stripe_user, resolve_owner_model, get_billing_model_options
 from drf_stripe.settings import drf_stripe_settings
 
-from django.apps import apps as django_apps
 from django.contrib.contenttypes.models import ContentType
 
 
+PRODUCT_FEATURES_CACHE_ATTR = "_cached_features"
+
+
+def prefetch_product_features(lookup):
+    """
+    Returns a Prefetch loading the ProductFeature links (and their Feature) of the product at the given lookup,
+    cached on the product so serializers can reuse it instead of querying per object.
+
+    :param str lookup: lookup path to Product.linked_features, ie: "price__product__linked_features"
+    """
+    return Prefetch(
+        lookup,
+        queryset=ProductFeature.objects.select_related("feature"),
+        to_attr=PRODUCT_FEATURES_CACHE_ATTR
+    )
+
+
+def _get_product_feature_ids(product):
+    """Serialize features linked to a product, using the prefetched links when available."""
+    links = getattr(product, PRODUCT_FEATURES_CACHE_ATTR, None)
+    if links is None:
+        links = product.linked_features.select_related("feature")
+    return [{"feature_id": link.feature.feature_id, "feature_desc": link.feature.description} for link in links]
+
+
 class SubscriptionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subscription
@@ -40,8 +66,7 @@ class SubscriptionItemSerializer(serializers.ModelSerializer):
     cancel_at_period_end = serializers.BooleanField(source='subscription.cancel_at_period_end')
 
     def get_feature_ids(self, obj):
-        return [{"feature_id": link.feature.feature_id, "feature_desc": link.feature.description} for link in
-                obj.price.product.linked_features.all().prefetch_related('feature')]
+        return _get_product_feature_ids(obj.price.product)
 
     def get_subscription_expires_at(self, obj):
         return obj.subscription.period_end or \
@@ -70,9 +95,7 @@ class PriceSerializer(serializers.ModelSerializer):
     services = serializers.SerializerMethodField(method_name='get_feature_ids')
 
     def get_feature_ids(self, obj):
-        return [{"feature_id": prod_feature.feature.feature_id, "feature_desc": prod_feature.feature.description} for
-                prod_feature in
-                obj.product.linked_features.all().prefetch_related("feature")]
+        return _get_product_feature_ids(obj.product)
 
     class Meta:
         model = Price
@@ -90,23 +113,8 @@ class CheckoutRequestSerializer(serializers.Serializer):
         request = self.context['request']
         price_id = attrs['price_id']
 
-        # set stripe api key
-        stripe_module = __import__('stripe')
-        stripe_module.api_key = drf_stripe_settings.STRIPE_API_SECRET
-
         # If billing model is not configured, keep legacy per-user flow (StripeUser)
-        billing_model_path = drf_stripe_settings.BILLING_ACCOUNT_MODEL
-        BillingModel = None
-        if billing_model_path:
-            try:
-                app_label, model_name = billing_model_path.split('.', 1)
-                BillingModel = django_apps.get_model(app_label, model_name)
-            except Exception:
-                # allow full label as fallback
-                try:
-                    BillingModel = django_apps.get_model(billing_model_path)
-                except Exception:
-                    BillingModel = None
+        BillingModel, uses_generic_relation, owner_field_name = get_billing_model_options()
 
         # Determine customer: either BillingModel (if configured) or legacy StripeUser
         customer_id = None
@@ -119,17 +127,7 @@ class CheckoutRequestSerializer(serializers.Serializer):
             try:
                 if owner_type and owner_id:
                     # owner_type may be 'app_label.ModelName' or 'modelname'
-                    if '.' in owner_type:
-                        owner_app_label, owner_model = owner_type.split('.', 1)
-                        owner_cls = django_apps.get_model(owner_app_label, owner_model)
-                    else:
-                        owner_cls = None
-                        for app_config in django_apps.get_app_configs():
-                            try:
-                                owner_cls = django_apps.get_model(app_config.label, owner_type)
-                                break
-                            except Exception:
-                                continue
+                    owner_cls = resolve_owner_model(owner_type)
                     if owner_cls is None:
                         raise ValidationError(f"Unknown owner_type {owner_type}")
                     owner_obj = owner_cls.objects.get(pk=owner_id)
@@ -140,16 +138,14 @@ class CheckoutRequestSerializer(serializers.Serializer):
                 # Attempt to find or create a BillingModel instance.
                 billing_account_instance = None
                 # Pattern 1: BillingModel uses Generic relation content_type/object_id
-                if hasattr(BillingModel, 'content_type'):
+                if uses_generic_relation:
                     ct = ContentType.objects.get_for_model(owner_obj.__class__)
                     billing_account_instance, _ = BillingModel.objects.get_or_create(content_type=ct, object_id=owner_obj.pk)
                 else:
                     # Pattern 2: BillingModel has an FK field to the owner with common names
-                    for field_name in ('owner', 'user', 'organization', 'team'):
-                        if field_name in [f.name for f in BillingModel._meta.get_fields()]:
-                            kwargs = {field_name: owner_obj}
-                            billing_account_instance, _ = BillingModel.objects.get_or_create(**kwargs)
-                            break
+                    if owner_field_name:
+                        kwargs = {owner_field_name: owner_obj}
+                        billing_account_instance, _ = BillingModel.objects.get_or_create(**kwargs)
                     if billing_account_instance is None:
                         # Last resort try get_or_create by pk if possible
                         try:
@@ -165,12 +161,12 @@ class CheckoutRequestSerializer(serializers.Serializer):
                 # Create/get stripe customer
                 try:
                     customer_id = billing_account_instance.get_or_create_stripe_customer(
-                        stripe_module,
+                        stripe,
                         email=getattr(request.user, drf_stripe_settings.DJANGO_USER_EMAIL_FIELD, None),
                         metadata={"owner_type": getattr(owner_obj.__class__, '__name__', ''), "owner_id": str(getattr(owner_obj, 'pk', ''))}
                     )
                 except TypeError:
-                    customer_id = billing_account_instance.get_or_create_stripe_customer(stripe_module)
+                    customer_id = billing_account_instance.get_or_create_stripe_customer(stripe)
             except ValidationError:
                 raise
             except Exception as e:
@@ -186,17 +182,17 @@ class CheckoutRequestSerializer(serializers.Serializer):
 
         # Create checkout session using customer_id (prefer package helper)
         try:
-            try:
+            if isinstance(customer_id, str) and customer_id:
                 checkout_session = stripe_api_create_checkout_session(customer_id=customer_id, price_id=price_id)
-            except TypeError:
+            else:
                 # fallback direct call
-                checkout_session = stripe_module.checkout.Session.create(
+                checkout_session = stripe.checkout.Session.create(
                     payment_method_types=drf_stripe_settings.DEFAULT_PAYMENT_METHOD_TYPES,
                     mode=drf_stripe_settings.DEFAULT_CHECKOUT_MODE,
                     line_items=[{"price": price_id, "quantity": getattr(billing_account_instance, "seats", drf_stripe_settings.DEFAULT_MAX_SUBSCRIPTION_QUANTITY)}],
                     customer=customer_id,
-                    success_url=f"{drf_stripe_settings.FRONT_END_BASE_URL}/{drf_stripe_settings.CHECKOUT_SUCCESS_URL_PATH}",
-                    cancel_url=f"{drf_stripe_settings.FRONT_END_BASE_URL}/{drf_stripe_settings.CHECKOUT_CANCEL_URL_PATH}",
+                    success_url=drf_stripe_settings.CHECKOUT_SUCCESS_URL,
+                    cancel_url=drf_stripe_settings.CHECKOUT_CANCEL_URL,
                     metadata={"owner_type": getattr(billing_account_instance.__class__, '__name__', '') if billing_account_instance else 'user', "owner_id": str(getattr(billing_account_instance, 'pk', getattr(request.user, 'pk', '')))}
                 )
             attrs['session_id'] = checkout_session['id']
@@ -24,44 +24,46 @@ DEFAULTS = {
     # If None, billing-account flows are disabled and legacy per-user behaviour is used.
     # Example: "myapp.OrganizationBillingAccount"
     "BILLING_ACCOUNT_MODEL": None,
+    # Optional dotted path to a callable that receives the billing webhook data dict and queues
+    # drf_stripe.stripe_webhooks.billing.map_billing_account(data) on a background worker.
+    # If None, billing-account mapping runs synchronously within the webhook request.
+    "BILLING_WEBHOOK_TASK": None,
     # Default quantity for subscription line items.
     "DEFAULT_MAX_SUBSCRIPTION_QUANTITY": 1,
 }
 
 
 class DrfStripeSettings:
+    """
+    DRF_STRIPE settings with defaults applied.
+    Every setting is resolved into a plain instance attribute at init and on reload(),
+    so reading a setting is a regular attribute access.
+    """
+
     def __init__(self, user_settings=None, defaults=None):
         self._user_settings = user_settings or {}
         self.defaults = defaults or DEFAULTS
-        self._cached_attrs = set()
+        self._populate()
 
     @property
     def user_settings(self):
-        if not hasattr(self, "_user_settings"):
-            self._user_settings = getattr(settings, "DRF_STRIPE", {})
         return self._user_settings
 
     def __getattr__(self, attr):
-        # check the setting is accepted
-        if attr not in self.defaults:
-            raise AttributeError(f"Invalid DRF_STRIPE setting: {attr}")
+        # only reached for names that were not populated from defaults
+        raise AttributeError(f"Invalid DRF_STRIPE setting: {attr}")
 
-        # get from user settings or default value
-        try:
-            val = self.user_settings[attr]
-        except KeyError:
-            val = self.defaults[attr]
+    def _populate(self):
+        for attr, default in self.defaults.items():
+            setattr(self, attr, self._user_settings.get(attr, default))
 
-        self._cached_attrs.add(attr)
-        setattr(self, attr, val)
-        return val
+        # front end URLs derived from the settings above
+        self.CHECKOUT_SUCCESS_URL = f"{self.FRONT_END_BASE_URL}/{self.CHECKOUT_SUCCESS_URL_PATH}"
+        self.CHECKOUT_CANCEL_URL = f"{self.FRONT_END_BASE_URL}/{self.CHECKOUT_CANCEL_URL_PATH}"
 
     def reload(self):
-        for attr in self._cached_attrs:
-            delattr(self, attr)
-        self._cached_attrs.clear()
-        if hasattr(self, "_user_settings"):
-            delattr(self, "_user_settings")
+        self._user_settings = getattr(settings, "DRF_STRIPE", None) or {}
+        self._populate()
 
 
 drf_stripe_settings = DrfStripeSettings(USER_SETTINGS, DEFAULTS)
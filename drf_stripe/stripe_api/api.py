@@ -1,4 +1,5 @@
 import stripe
+from django.test.signals import setting_changed
 
 from ..settings import drf_stripe_settings
 
@@ -6,3 +7,31 @@ stripe.api_key = drf_stripe_settings.STRIPE_API_SECRET
 stripe.api_version = "2020-08-27"
 
 stripe_api = stripe
+
+# number of objects written to the database per transaction when syncing every page of a Stripe list
+SYNC_CHUNK_SIZE = 500
+
+
+def iter_list_chunks(list_response, chunk_size=SYNC_CHUNK_SIZE):
+    """
+    Iterate over every object of a Stripe list response, following pagination, in lists of at most chunk_size objects.
+
+    :param list_response: response from a Stripe list API call, ie: stripe.Customer.list()
+    :param int chunk_size: maximum number of objects per chunk
+    """
+    chunk = []
+    for obj in list_response.auto_paging_iter():
+        chunk.append(obj)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def reload_stripe_api_key(*args, **kwargs):
+    if kwargs["setting"] == "DRF_STRIPE":
+        stripe.api_key = drf_stripe_settings.STRIPE_API_SECRET
+
+
+setting_changed.connect(reload_stripe_api_key)
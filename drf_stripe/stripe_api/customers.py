@@ -1,16 +1,22 @@
+import logging
+from functools import lru_cache
+from operator import attrgetter
 from typing import overload
 
 from django.apps import apps
 from django.contrib.contenttypes.models import ContentType
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
 from django.db.transaction import atomic
+from django.test.signals import setting_changed
 
 from drf_stripe.models import get_drf_stripe_user_model as get_user_model
 from drf_stripe.models import StripeUser
-from drf_stripe.stripe_api.api import stripe_api as stripe
+from drf_stripe.stripe_api.api import stripe_api as stripe, iter_list_chunks
 from drf_stripe.stripe_models.customer import StripeCustomers, StripeCustomer
 from ..settings import drf_stripe_settings
 
+logger = logging.getLogger(__name__)
+
 
 class CreatingNewUsersDisabledError(Exception):
     pass
@@ -20,7 +26,17 @@ def get_billing_model():
     """
     Returns the BillingAccount model class if BILLING_ACCOUNT_MODEL is configured, else None.
     """
-    billing_model_path = drf_stripe_settings.BILLING_ACCOUNT_MODEL
+    return _resolve_billing_model(drf_stripe_settings.BILLING_ACCOUNT_MODEL)
+
+
+@lru_cache(maxsize=None)
+def _resolve_billing_model(billing_model_path):
+    """
+    Returns the model class for a BILLING_ACCOUNT_MODEL path, or None if it is empty or cannot be resolved.
+    Cached per path, so the setting is only parsed once.
+
+    :param str billing_model_path: 'app_label.ModelName'
+    """
     if not billing_model_path:
         return None
     try:
@@ -33,35 +49,215 @@ def get_billing_model():
             return None
 
 
+BILLING_OWNER_FIELD_NAMES = ('owner', 'user', 'organization', 'team')
+
+
+@lru_cache(maxsize=None)
+def get_billing_model_options():
+    """
+    Returns a (billing_model, uses_generic_relation, owner_field_name) tuple describing the configured
+    BILLING_ACCOUNT_MODEL, or (None, False, None) if it is not configured.
+    The model is introspected once and cached until DRF_STRIPE settings change.
+
+    uses_generic_relation is True when the billing model references its owner through content_type/object_id;
+    owner_field_name is the first of BILLING_OWNER_FIELD_NAMES defined on the billing model, if any.
+    """
+    billing_model = get_billing_model()
+    if billing_model is None:
+        return None, False, None
+
+    uses_generic_relation = hasattr(billing_model, 'content_type')
+    field_names = {f.name for f in billing_model._meta.get_fields()}
+    owner_field_name = next((name for name in BILLING_OWNER_FIELD_NAMES if name in field_names), None)
+    return billing_model, uses_generic_relation, owner_field_name
+
+
+@lru_cache(maxsize=32)
+def get_owner_fk_attname(billing_model, owner_model):
+    """
+    Returns the attname (ie: 'owner_id') of the billing model's foreign key to owner_model named in
+    BILLING_OWNER_FIELD_NAMES, or None if the billing model has no such foreign key.
+    Other foreign keys to owner_model, ie: AbstractBillingAccount.manager_user, do not identify the owner.
+
+    :param billing_model: The BillingAccount model class
+    :param owner_model: model class of the billing account owner
+    """
+    foreign_keys = {
+        field.name: field.attname for field in billing_model._meta.get_fields()
+        if field.concrete and (field.many_to_one or field.one_to_one) and field.related_model is owner_model
+    }
+    return next((foreign_keys[name] for name in BILLING_OWNER_FIELD_NAMES if name in foreign_keys), None)
+
+
+@lru_cache(maxsize=256)
+def resolve_owner_model(owner_type):
+    """
+    Returns the model class for a billing owner_type, given as 'app_label.ModelName' or as a bare model name.
+    A bare model name resolves to the first installed app that defines it, or None if no app does.
+    Results are cached per owner_type.
+
+    :param str owner_type: 'app_label.ModelName' or 'modelname'
+    """
+    if '.' in owner_type:
+        app_label, model_name = owner_type.split('.', 1)
+        return apps.get_model(app_label, model_name)
+
+    return _get_models_by_name().get(owner_type.lower())
+
+
+@lru_cache(maxsize=1)
+def _get_models_by_name():
+    """
+    Returns a dict of installed model classes keyed by lowercase model name, built once.
+    When several apps define a model with the same name, the first installed app wins.
+    """
+    models_by_name = {}
+    for app_config in apps.get_app_configs():
+        for model in app_config.get_models():
+            models_by_name.setdefault(model._meta.model_name, model)
+    return models_by_name
+
+
+@lru_cache(maxsize=None)
+def model_has_field(model, field_name):
+    """
+    Returns True if the model class defines a field with the given name, cached per model and field name.
+
+    :param model: Django model class
+    :param str field_name: field name
+    """
+    try:
+        model._meta.get_field(field_name)
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+BILLING_ACCOUNT_SYNC_FIELDS = ('stripe_customer_id', 'stripe_subscription_id', 'manager_user')
+
+
+@lru_cache(maxsize=None)
+def get_billing_account_sync_fields(billing_model):
+    """
+    Returns the names of BILLING_ACCOUNT_SYNC_FIELDS defined on the billing model, which are the only
+    billing account fields read or written when syncing with Stripe.
+
+    :param billing_model: The BillingAccount model class
+    """
+    return tuple(name for name in BILLING_ACCOUNT_SYNC_FIELDS if model_has_field(billing_model, name))
+
+
+@lru_cache(maxsize=1)
+def _get_user_create_defaults_getters():
+    """
+    Returns (user field, attrgetter) pairs built once from USER_CREATE_DEFAULTS_ATTRIBUTE_MAP,
+    until DRF_STRIPE settings change.
+    """
+    attribute_map = drf_stripe_settings.USER_CREATE_DEFAULTS_ATTRIBUTE_MAP or {}
+    return tuple((field, attrgetter(attribute)) for field, attribute in attribute_map.items())
+
+
+def get_user_create_defaults(customer: StripeCustomer):
+    """
+    Returns the attributes of a new Django user created for a Stripe customer, according to USER_CREATE_DEFAULTS_ATTRIBUTE_MAP.
+
+    :param customer: Stripe customer record
+    """
+    return {field: getter(customer) for field, getter in _get_user_create_defaults_getters()}
+
+
+def _clear_model_caches(*args, **kwargs):
+    setting = kwargs["setting"]
+    if setting == "DRF_STRIPE":
+        _get_user_create_defaults_getters.cache_clear()
+    if setting in ("DRF_STRIPE", "INSTALLED_APPS"):
+        get_billing_model_options.cache_clear()
+    if setting == "INSTALLED_APPS":
+        _resolve_billing_model.cache_clear()
+        resolve_owner_model.cache_clear()
+        _get_models_by_name.cache_clear()
+        get_owner_fk_attname.cache_clear()
+        model_has_field.cache_clear()
+        get_billing_account_sync_fields.cache_clear()
+
+
+setting_changed.connect(_clear_model_caches)
+
+
 def find_billing_account(billing_model, customer_id=None, user=None):
     """
     Find a billing account instance by stripe_customer_id or by manager_user.
 
+    Only the Stripe fields and manager user are loaded, other fields are deferred.
+
     :param billing_model: The BillingAccount model class
     :param customer_id: Stripe customer id (optional)
-    :param user: Django user instance (optional)
+    :param user: Django user instance or id (optional)
     :return: billing account instance or None
     """
     if billing_model is None:
         return None
-    
+
+    billing_accounts = billing_model.objects.only(*get_billing_account_sync_fields(billing_model))
+
     # First try by customer_id
-    if customer_id:
-        try:
-            return billing_model.objects.filter(stripe_customer_id=customer_id).first()
-        except Exception:
-            pass
-    
+    if customer_id and model_has_field(billing_model, "stripe_customer_id"):
+        billing_account = billing_accounts.filter(stripe_customer_id=customer_id).first()
+        if billing_account:
+            return billing_account
+
     # Then try by manager_user
-    if user:
-        try:
-            return billing_model.objects.filter(manager_user=user).first()
-        except Exception:
-            pass
-    
+    if user and model_has_field(billing_model, "manager_user"):
+        return billing_accounts.filter(manager_user=user).first()
+
     return None
 
 
+def find_billing_accounts(billing_model, customer_ids=(), user_ids=()):
+    """
+    Bulk counterpart of find_billing_account(), fetching the billing accounts for many customers and users
+    with one query each. Look up by customer id first, then by manager user id.
+
+    :param billing_model: The BillingAccount model class
+    :param customer_ids: Stripe customer ids
+    :param user_ids: Django user ids of billing account managers
+    :return: tuple of dicts (billing accounts by stripe_customer_id, billing accounts by manager_user_id)
+    """
+    billing_accounts = billing_model.objects.only(*get_billing_account_sync_fields(billing_model)).order_by("-pk")
+
+    # iterate by descending pk so the first matching account wins, as with find_billing_account()
+    by_customer_id = {}
+    if customer_ids and model_has_field(billing_model, "stripe_customer_id"):
+        for billing_account in billing_accounts.filter(stripe_customer_id__in=customer_ids):
+            by_customer_id[billing_account.stripe_customer_id] = billing_account
+
+    by_user_id = {}
+    if user_ids and model_has_field(billing_model, "manager_user"):
+        for billing_account in billing_accounts.filter(manager_user_id__in=user_ids):
+            by_user_id[billing_account.manager_user_id] = billing_account
+
+    return by_customer_id, by_user_id
+
+
+def set_billing_account_subscription_fields(billing_account, customer_id, subscription_id):
+    """
+    Set the Stripe customer and subscription ids on a billing account without saving it.
+
+    :param billing_account: The billing account instance
+    :param customer_id: Stripe customer id, only set if the billing account has none
+    :param subscription_id: Stripe subscription id
+    :return: list of changed field names
+    """
+    update_fields = []
+    if not billing_account.stripe_customer_id:
+        billing_account.stripe_customer_id = customer_id
+        update_fields.append("stripe_customer_id")
+    if billing_account.stripe_subscription_id != subscription_id:
+        billing_account.stripe_subscription_id = subscription_id
+        update_fields.append("stripe_subscription_id")
+    return update_fields
+
+
 def update_billing_account_subscription(billing_model, billing_account, customer_id, subscription_id, subscription_defaults):
     """
     Update billing account stripe fields and add billing account link to subscription defaults.
@@ -77,18 +273,12 @@ def update_billing_account_subscription(billing_model, billing_account, customer
         return subscription_defaults
 
     # Update billing account stripe fields
-    update_fields = []
-    if not billing_account.stripe_customer_id:
-        billing_account.stripe_customer_id = customer_id
-        update_fields.append("stripe_customer_id")
-    if billing_account.stripe_subscription_id != subscription_id:
-        billing_account.stripe_subscription_id = subscription_id
-        update_fields.append("stripe_subscription_id")
+    update_fields = set_billing_account_subscription_fields(billing_account, customer_id, subscription_id)
     if update_fields:
         billing_account.save(update_fields=update_fields)
 
     # Link subscription to billing account
-    subscription_defaults["billing_account_content_type"] = ContentType.objects.get_for_model(billing_model)
+    subscription_defaults["billing_account_content_type_id"] = ContentType.objects.get_for_model(billing_model).pk
     subscription_defaults["billing_account_object_id"] = billing_account.pk
 
     return subscription_defaults
@@ -171,14 +361,15 @@ def _get_or_create_stripe_user_from_customer_id(customer_id):
     """
 
     try:
-        user = get_user_model().objects.get(stripe_user__customer_id=customer_id)
-
+        return StripeUser.objects.get(customer_id=customer_id)
     except ObjectDoesNotExist:
-        customer_response = stripe.Customer.retrieve(customer_id)
-        customer = StripeCustomer(**customer_response)
-        user, created = _get_or_create_django_user_if_configured(customer)
-        if created:
-            print(f"Created new User with customer_id {customer_id}")
+        pass
+
+    customer_response = stripe.Customer.retrieve(customer_id)
+    customer = StripeCustomer(**customer_response)
+    user, created = _get_or_create_django_user_if_configured(customer)
+    if created:
+        logger.info("Created new User with customer_id %s", customer_id)
 
     return _get_or_create_stripe_user_from_user_id_email(user.id, user.email, customer_id)
 
@@ -204,8 +395,7 @@ def _get_or_create_django_user_if_configured(customer: StripeCustomer):
     if not drf_stripe_settings.USER_CREATE_DEFAULTS_ATTRIBUTE_MAP:
         raise CreatingNewUsersDisabledError(f"No Django user exists with Stripe customer id '{customer.id}'s email and USER_CREATE_DEFAULTS_ATTRIBUTE_MAP is not set so a Django user cannot be created.")
 
-    defaults = {k: getattr(customer, v) for k, v in
-                drf_stripe_settings.USER_CREATE_DEFAULTS_ATTRIBUTE_MAP.items()}
+    defaults = get_user_create_defaults(customer)
     defaults[drf_stripe_settings.DJANGO_USER_EMAIL_FIELD] = customer.email
     django_user = get_user_model().objects.create(
         **defaults
@@ -238,14 +428,13 @@ def get_or_create_stripe_user_from_customer(customer: StripeCustomer) -> StripeU
             if not drf_stripe_settings.USER_CREATE_DEFAULTS_ATTRIBUTE_MAP:
                 raise CreatingNewUsersDisabledError(f"No Django user exists with Stripe customer id '{customer.id}'s email and USER_CREATE_DEFAULTS_ATTRIBUTE_MAP is not set so a Django user cannot be created.")
 
-            defaults = {k: getattr(customer, v) for k, v in
-                            drf_stripe_settings.USER_CREATE_DEFAULTS_ATTRIBUTE_MAP.items()}
+            defaults = get_user_create_defaults(customer)
             defaults[drf_stripe_settings.DJANGO_USER_EMAIL_FIELD] = customer.email
             django_user = get_user_model().objects.create(
                 **defaults
             )
 
-            print(f"Created new Django User with email address for Stripe customer_id {customer.id}")
+            logger.info("Created new Django User with email address for Stripe customer_id %s", customer.id)
 
         stripe_user, stripe_user_created = StripeUser.objects.get_or_create(user_id=django_user.id, defaults={'customer_id': customer.id})
         if not stripe_user_created and stripe_user.customer_id:
@@ -261,6 +450,7 @@ def get_or_create_stripe_user_from_customer(customer: StripeCustomer) -> StripeU
 def _get_or_create_stripe_user_from_user_id_email(user_id, user_email: str, customer_id: str = None):
     """
     Return a StripeUser instance given user_id and user_email.
+    Stripe's customer API is only called when a new StripeUser is created and customer_id is not given.
 
     :param user_id: user id
     :param str user_email: user email address
@@ -272,7 +462,11 @@ def _get_or_create_stripe_user_from_user_id_email(user_id, user_email: str, cust
     if created and not customer_id:
         customer = _stripe_api_get_or_create_customer_from_email(user_email)
         stripe_user.customer_id = customer.id
-        stripe_user.save()
+        stripe_user.save(update_fields=["customer_id"])
+    elif customer_id and not stripe_user.customer_id:
+        # existing StripeUser without a customer, use the known id rather than searching Stripe for it later
+        stripe_user.customer_id = customer_id
+        stripe_user.save(update_fields=["customer_id"])
 
     return stripe_user
 
@@ -296,8 +490,7 @@ def _stripe_api_get_or_create_customer_from_email(user_email: str):
     return customer
 
 
-@atomic
-def stripe_api_update_customers(limit=100, starting_after=None, test_data=None):
+def stripe_api_update_customers(limit=100, starting_after=None, test_data=None, all_pages=False):
     """
     Retrieve list of Stripe customer objects, create StripeUser instances and optionally Django User.
     If a Django user does not exist a Django User will be created if setting USER_CREATE_DEFAULTS_ATTRIBUTE_MAP is set,
@@ -308,9 +501,12 @@ def stripe_api_update_customers(limit=100, starting_after=None, test_data=None):
 
     Called from management command.
 
-    :param int limit: Limit the number of customers to retrieve
+    :param int limit: Limit the number of customers to retrieve, or the page size if all_pages is True
     :param str starting_after: Stripe Customer id to start retrieval
     :param test_data: Stripe.Customer.list API response, used for testing
+    :param bool all_pages: if True, retrieve every customer after starting_after, one page at a time,
+        updating the database in a separate transaction for each chunk of customers.
+    :return: number of Django users created and number of users linked to Stripe customers
     """
 
     if limit < 0 or limit > 100:
@@ -321,48 +517,101 @@ def stripe_api_update_customers(limit=100, starting_after=None, test_data=None):
     else:
         customers_response = test_data
 
-    stripe_customers = StripeCustomers(**customers_response).data
+    if all_pages and test_data is None:
+        chunks = iter_list_chunks(customers_response)
+    else:
+        chunks = [customers_response["data"]]
+
+    user_creation_count = 0
+    stripe_user_creation_count = 0
+    for chunk in chunks:
+        # Stripe customer can have null as email, such customers are skipped before being validated
+        chunk_user_count, chunk_stripe_user_count = _update_customers(
+            [StripeCustomer(**customer) for customer in chunk if customer.get("email") is not None]
+        )
+        user_creation_count += chunk_user_count
+        stripe_user_creation_count += chunk_stripe_user_count
+
+    return user_creation_count, stripe_user_creation_count
+
 
+@atomic
+def _update_customers(stripe_customers):
+    """
+    Create StripeUser instances, and Django Users if configured, for a list of Stripe customers.
+
+    :param stripe_customers: list of StripeCustomer having an email address
+    :return: tuple of (number of Django users created, number of StripeUsers created)
+    """
     billing_model = get_billing_model()
+    user_model = get_user_model()
+    email_field = drf_stripe_settings.DJANGO_USER_EMAIL_FIELD
 
+    # Resolve users of the whole page in one query, creating the missing ones if configured.
+    # Users are created one by one so that the user model's save() and signals still run.
+    users_by_email = _get_users_by_email({customer.email for customer in stripe_customers})
     user_creation_count = 0
-    stripe_user_creation_count = 0
+    if drf_stripe_settings.USER_CREATE_DEFAULTS_ATTRIBUTE_MAP:
+        for customer in stripe_customers:
+            if customer.email not in users_by_email:
+                defaults = get_user_create_defaults(customer)
+                users_by_email[customer.email] = user_model.objects.create(
+                    **{email_field: customer.email, **defaults}
+                )
+                user_creation_count += 1
+
+    stripe_users = StripeUser.objects.in_bulk([user.pk for user in users_by_email.values()])
+    new_stripe_users = {}
+
+    if billing_model:
+        _, billing_accounts_by_user_id = find_billing_accounts(
+            billing_model, user_ids=[user.pk for user in users_by_email.values()]
+        )
+    changed_billing_accounts = {}
 
     for customer in stripe_customers:
-        # Stripe customer can have null as email
-        if customer.email is not None:
-            query_filters = {drf_stripe_settings.DJANGO_USER_EMAIL_FIELD: customer.email}
-            if drf_stripe_settings.USER_CREATE_DEFAULTS_ATTRIBUTE_MAP:
-                defaults = {k: getattr(customer, v) for k, v in
-                    drf_stripe_settings.USER_CREATE_DEFAULTS_ATTRIBUTE_MAP.items()}
-                user, user_created = get_user_model().objects.get_or_create(
-                    **query_filters,
-                    defaults=defaults
-                )
-            else:
-                user_created = False
-                user = get_user_model().objects.filter(
-                    **query_filters
-                ).first()
-
-            if user:
-                stripe_user, stripe_user_created = StripeUser.objects.get_or_create(user=user,
-                                                                                    defaults={"customer_id": customer.id})
-                print(f"Updated Stripe Customer {customer.id}")
-
-                # Update billing account if configured
-                if billing_model:
-                    billing_account = find_billing_account(billing_model, user=user)
-                    if billing_account and not billing_account.stripe_customer_id:
-                        billing_account.stripe_customer_id = customer.id
-                        billing_account.save(update_fields=["stripe_customer_id"])
-                        print(f"Updated billing account {billing_account.pk} with stripe_customer_id {customer.id}")
-
-                if user_created is True:
-                    user_creation_count += 1
-                if stripe_user_created is True:
-                    stripe_user_creation_count += 1
-            else:
-                print(f"Could not find Stripe Customer id '{customer.id}' in user model '{get_user_model()}' with '{drf_stripe_settings.DJANGO_USER_EMAIL_FIELD}' of '{customer.email}', USER_CREATE_DEFAULTS_ATTRIBUTE_MAP is not set so skipping Customer.")
-
-    print(f"{user_creation_count} user(s) created, {stripe_user_creation_count} user(s) linked to Stripe customers.")
+        user = users_by_email.get(customer.email)
+        if user is None:
+            logger.warning(
+                "Could not find Stripe Customer id '%s' in user model '%s' with '%s' of '%s', "
+                "USER_CREATE_DEFAULTS_ATTRIBUTE_MAP is not set so skipping Customer.",
+                customer.id, user_model, email_field, customer.email
+            )
+            continue
+
+        if user.pk not in stripe_users and user.pk not in new_stripe_users:
+            new_stripe_users[user.pk] = StripeUser(user=user, customer_id=customer.id)
+        logger.debug("Updated Stripe Customer %s", customer.id)
+
+        # Update billing account if configured
+        if billing_model:
+            billing_account = billing_accounts_by_user_id.get(user.pk)
+            if billing_account and not billing_account.stripe_customer_id:
+                billing_account.stripe_customer_id = customer.id
+                changed_billing_accounts[billing_account.pk] = billing_account
+                logger.debug("Updated billing account %s with stripe_customer_id %s", billing_account.pk, customer.id)
+
+    stripe_user_creation_count = 0
+    if new_stripe_users:
+        # Rows skipped by ignore_conflicts, ie: StripeUsers created concurrently, are not reported by bulk_create,
+        # so count the StripeUsers of these users around the insert.
+        new_user_stripe_users = StripeUser.objects.filter(pk__in=new_stripe_users.keys())
+        existing_count = new_user_stripe_users.count()
+        StripeUser.objects.bulk_create(new_stripe_users.values(), ignore_conflicts=True)
+        stripe_user_creation_count = new_user_stripe_users.count() - existing_count
+    if changed_billing_accounts:
+        billing_model.objects.bulk_update(changed_billing_accounts.values(), ["stripe_customer_id"])
+
+    return user_creation_count, stripe_user_creation_count
+
+
+def _get_users_by_email(emails):
+    """
+    Returns a dict of Django users keyed by email, fetched in a single query.
+    If several users share an email, the one with the lowest pk is used.
+
+    :param emails: collection of email addresses
+    """
+    email_field = drf_stripe_settings.DJANGO_USER_EMAIL_FIELD
+    users = get_user_model().objects.filter(**{f"{email_field}__in": emails}).order_by("-pk")
+    return {getattr(user, email_field): user for user in users}
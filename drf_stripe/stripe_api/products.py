@@ -1,3 +1,5 @@
+import logging
+
 from django.db.models import Q
 from django.db.transaction import atomic
 
@@ -6,6 +8,8 @@ from .api import stripe_api as stripe
 from ..stripe_models.price import StripePrices
 from ..stripe_models.product import StripeProducts
 
+logger = logging.getLogger(__name__)
+
 
 @atomic()
 def stripe_api_update_products_prices(**kwargs):
@@ -13,9 +17,9 @@ def stripe_api_update_products_prices(**kwargs):
     Fetches list of Products and Price from Stripe, updates database.
     :key dict test_products: mock event data for testing
     :key dict test_prices: mock event data for testing
+    :return: number of Products and number of Prices created
     """
-    _stripe_api_fetch_update_products(**kwargs)
-    _stripe_api_fetch_update_prices(**kwargs)
+    return _stripe_api_fetch_update_products(**kwargs), _stripe_api_fetch_update_prices(**kwargs)
 
 
 def _stripe_api_fetch_update_products(test_products=None, **kwargs):
@@ -45,7 +49,7 @@ def _stripe_api_fetch_update_products(test_products=None, **kwargs):
         if created is True:
             creation_count += 1
 
-    print(f"Created {creation_count} new Products")
+    return creation_count
 
 
 def _stripe_api_fetch_update_prices(test_prices=None, **kwargs):
@@ -77,7 +81,7 @@ def _stripe_api_fetch_update_prices(test_prices=None, **kwargs):
         if created is True:
             creation_count += 1
 
-    print(f"Created {creation_count} new Prices")
+    return creation_count
 
 
 def get_freq_from_stripe_price(price_data):
@@ -109,5 +113,4 @@ def create_update_product_features(product_data):
             ProductFeature.objects.get_or_create(product_id=product_data.id, feature=feature)
 
             if created_new_feature:
-                print(
-                    f"Created new feature_id {feature_id}, please set feature description manually in database.")
+                logger.info("Created new feature_id %s, please set feature description manually in database.", feature_id)
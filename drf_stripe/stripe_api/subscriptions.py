@@ -1,16 +1,19 @@
-from itertools import chain
-from operator import attrgetter
+import logging
 from typing import Literal, List
 
-from django.db.models import Q
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q, prefetch_related_objects
 from django.db.models import QuerySet
 from django.db.transaction import atomic
 
-from drf_stripe.stripe_api.api import stripe_api as stripe
-from .customers import get_or_create_stripe_user, CreatingNewUsersDisabledError, get_billing_model, find_billing_account, update_billing_account_subscription
-from ..models import Subscription, Price, SubscriptionItem
+from drf_stripe.stripe_api.api import stripe_api as stripe, iter_list_chunks
+from .customers import get_or_create_stripe_user, CreatingNewUsersDisabledError, get_billing_model, \
+    find_billing_accounts, set_billing_account_subscription_fields
+from ..models import StripeUser, Subscription, Price, Product, SubscriptionItem
 from ..stripe_models.subscription import ACCESS_GRANTING_STATUSES, StripeSubscriptions
 
+logger = logging.getLogger(__name__)
+
 """
 status argument, see https://stripe.com/docs/api/subscriptions/list?lang=python#list_subscriptions-status
 """
@@ -27,19 +30,21 @@ STATUS_ARG = Literal[
 ]
 
 
-@atomic
 def stripe_api_update_subscriptions(status: STATUS_ARG = None, limit: int = 100, starting_after: str = None,
-                                    test_data=None, ignore_new_user_creation_errors = False):
+                                    test_data=None, ignore_new_user_creation_errors = False, all_pages=False):
     """
     Retrieve all subscriptions. Updates database.
 
     Called from management command.
 
     :param STATUS_ARG status: subscription status to retrieve.
-    :param int limit: number of instances to retrieve( between 0 and 100).
+    :param int limit: number of instances to retrieve( between 0 and 100), or the page size if all_pages is True.
     :param str starting_after: subscription id to start retrieving.
     :param test_data: response data from Stripe API stripe.Subscription.list, used for testing
     :param ignore_new_user_creation_errors: if True, CreatingNewUsersDisabledError thrown by get_or_create_stripe_user() will be skipped
+    :param bool all_pages: if True, retrieve every subscription after starting_after, one page at a time,
+        updating the database in a separate transaction for each chunk of subscriptions.
+    :return: number of Subscriptions created
     """
 
     if limit < 0 or limit > 100:
@@ -50,65 +55,116 @@ def stripe_api_update_subscriptions(status: STATUS_ARG = None, limit: int = 100,
     else:
         subscriptions_response = test_data
 
-    stripe_subscriptions = StripeSubscriptions(**subscriptions_response).data
-
-    billing_model = get_billing_model()
+    if all_pages and test_data is None:
+        chunks = iter_list_chunks(subscriptions_response)
+    else:
+        chunks = [subscriptions_response["data"]]
 
     creation_count = 0
+    for chunk in chunks:
+        creation_count += _update_subscriptions(
+            StripeSubscriptions(data=chunk).data, ignore_new_user_creation_errors=ignore_new_user_creation_errors
+        )
+
+    return creation_count
+
+
+@atomic
+def _update_subscriptions(stripe_subscriptions, ignore_new_user_creation_errors=False):
+    """
+    Create or update Subscriptions and their SubscriptionItems from a list of Stripe subscriptions.
+
+    :param stripe_subscriptions: list of StripeSubscription
+    :param ignore_new_user_creation_errors: if True, CreatingNewUsersDisabledError thrown by get_or_create_stripe_user() will be skipped
+    :return: number of Subscriptions created
+    """
+    billing_model = get_billing_model()
 
+    # Resolve the StripeUser of every subscription first, so billing accounts can be looked up in bulk.
+    # Existing StripeUsers are loaded in one query, only unknown customers go through get_or_create_stripe_user().
+    stripe_users = {
+        stripe_user.customer_id: stripe_user for stripe_user in
+        StripeUser.objects.filter(customer_id__in={subscription.customer for subscription in stripe_subscriptions})
+    }
+    subscriptions_with_users = []
     for subscription in stripe_subscriptions:
         try:
-            stripe_user = get_or_create_stripe_user(customer_id=subscription.customer)
-
-            subscription_defaults = {
-                "stripe_user": stripe_user,
-                "period_start": subscription.current_period_start,
-                "period_end": subscription.current_period_end,
-                "cancel_at": subscription.cancel_at,
-                "cancel_at_period_end": subscription.cancel_at_period_end,
-                "ended_at": subscription.ended_at,
-                "status": subscription.status,
-                "trial_end": subscription.trial_end,
-                "trial_start": subscription.trial_start
-            }
-
-            # Link to billing account if configured
-            if billing_model:
-                user = stripe_user.user if stripe_user else None
-                billing_account = find_billing_account(billing_model, customer_id=subscription.customer, user=user)
-                subscription_defaults = update_billing_account_subscription(
-                    billing_model, billing_account, subscription.customer, subscription.id, subscription_defaults
-                )
-
-            _, created = Subscription.objects.update_or_create(
-                subscription_id=subscription.id,
-                defaults=subscription_defaults
-            )
-            print(f"Updated subscription {subscription.id}")
-            _update_subscription_items(subscription.id, subscription.items.data)
-            if created is True:
-                creation_count += 1
+            stripe_user = stripe_users.get(subscription.customer) or \
+                          get_or_create_stripe_user(customer_id=subscription.customer)
         except CreatingNewUsersDisabledError as e:
             if not ignore_new_user_creation_errors:
                 raise e
             else:
-                print(f"User for customer id '{subscription.customer}' with subscription '{subscription.id}' does not exist, skipping.")
+                logger.warning(
+                    "User for customer id '%s' with subscription '%s' does not exist, skipping.",
+                    subscription.customer, subscription.id
+                )
+            continue
+        stripe_users[subscription.customer] = stripe_user
+        subscriptions_with_users.append((subscription, stripe_user))
+
+    if billing_model:
+        billing_model_ct_id = ContentType.objects.get_for_model(billing_model).pk
+        billing_accounts_by_customer_id, billing_accounts_by_user_id = find_billing_accounts(
+            billing_model,
+            customer_ids={subscription.customer for subscription, _ in subscriptions_with_users},
+            user_ids={stripe_user.user_id for _, stripe_user in subscriptions_with_users}
+        )
+    changed_billing_accounts = {}
 
-    print(f"Created {creation_count} new Subscriptions.")
+    creation_count = 0
+
+    for subscription, stripe_user in subscriptions_with_users:
+        subscription_defaults = {
+            "stripe_user": stripe_user,
+            "period_start": subscription.current_period_start,
+            "period_end": subscription.current_period_end,
+            "cancel_at": subscription.cancel_at,
+            "cancel_at_period_end": subscription.cancel_at_period_end,
+            "ended_at": subscription.ended_at,
+            "status": subscription.status,
+            "trial_end": subscription.trial_end,
+            "trial_start": subscription.trial_start
+        }
+
+        # Link to billing account if configured
+        if billing_model:
+            billing_account = billing_accounts_by_customer_id.get(subscription.customer) or \
+                              billing_accounts_by_user_id.get(stripe_user.user_id)
+            if billing_account:
+                if set_billing_account_subscription_fields(billing_account, subscription.customer, subscription.id):
+                    changed_billing_accounts[billing_account.pk] = billing_account
+                subscription_defaults["billing_account_content_type_id"] = billing_model_ct_id
+                subscription_defaults["billing_account_object_id"] = billing_account.pk
+
+        _, created = Subscription.objects.update_or_create(
+            subscription_id=subscription.id,
+            defaults=subscription_defaults
+        )
+        logger.debug("Updated subscription %s", subscription.id)
+        _update_subscription_items(subscription.id, subscription.items.data)
+        if created is True:
+            creation_count += 1
+
+    if changed_billing_accounts:
+        billing_model.objects.bulk_update(
+            changed_billing_accounts.values(), ["stripe_customer_id", "stripe_subscription_id"]
+        )
+
+    return creation_count
 
 
 def _update_subscription_items(subscription_id, items_data):
     SubscriptionItem.objects.filter(subscription=subscription_id).delete()
-    for item in items_data:
-        _, created = SubscriptionItem.objects.update_or_create(
+    SubscriptionItem.objects.bulk_create([
+        SubscriptionItem(
             sub_item_id=item.id,
-            defaults={
-                "subscription_id": subscription_id,
-                "price_id": item.price.id,
-                "quantity": item.quantity
-            }
-        )
-        print(f"Updated sub item {item.id}")
+            subscription_id=subscription_id,
+            price_id=item.price.id,
+            quantity=item.quantity
+        ) for item in items_data
+    ], batch_size=500)
+    logger.debug("Updated %d sub item(s) of subscription %s", len(items_data), subscription_id)
 
 
 # def _stripe_api_update_subscription_items(subscription_id, limit=100, ending_before=None, test_data=None):
@@ -156,6 +212,20 @@ def list_user_subscriptions(user_id, current=True) -> QuerySet[Subscription]:
     return Subscription.objects.filter(q)
 
 
+def prefetch_billing_accounts(subscriptions) -> List[Subscription]:
+    """
+    Resolve the billing accounts of many Subscriptions using one query per billing model,
+    caching each on its Subscription so reading subscription.billing_account does not query again.
+    Equivalent to prefetch_related("billing_account") for Subscriptions that are already loaded.
+
+    :param subscriptions: iterable of Subscription instances, ie: a QuerySet.
+    :return: list of the given Subscriptions.
+    """
+    subscriptions = list(subscriptions)
+    prefetch_related_objects(subscriptions, "billing_account")
+    return subscriptions
+
+
 def list_user_subscription_items(user_id, current=True) -> QuerySet[SubscriptionItem]:
     """
     Retrieve a set of SubscriptionItems associated with user id
@@ -171,7 +241,7 @@ def list_user_subscription_items(user_id, current=True) -> QuerySet[Subscription
     return SubscriptionItem.objects.filter(q)
 
 
-def list_user_subscription_products(user_id, current=True):
+def list_user_subscription_products(user_id, current=True) -> QuerySet[Product]:
     """
     Retrieve a set of Product instances associated with a given User instance.
 
@@ -179,11 +249,8 @@ def list_user_subscription_products(user_id, current=True):
     :param bool current: Defaults to True and retrieves only products associated with current subscriptions
         (excluding any cancelled, ended, unpaid subscription products)
     """
-    subscriptions = list_user_subscriptions(user_id, current=current)
-    sub_items = chain.from_iterable(
-        sub.items.all() for sub in subscriptions.all().prefetch_related("items__price__product"))
-    products = set(item.price.product for item in sub_items)
-    return products
+    sub_items = list_user_subscription_items(user_id, current=current)
+    return Product.objects.filter(prices__in=sub_items.values('price')).distinct()
 
 
 def list_subscribable_product_prices_to_user(user_id):
@@ -192,11 +259,11 @@ def list_subscribable_product_prices_to_user(user_id):
 
     :param user_id: Django user id.
     """
-    current_products = set(map(attrgetter('product_id'), list_user_subscription_products(user_id)))
+    current_product_ids = list_user_subscription_products(user_id).values_list('product_id', flat=True)
     prices = Price.objects.filter(
         Q(active=True) &
         Q(product__active=True) &
-        ~Q(product__product_id__in=current_products)
+        ~Q(product__product_id__in=current_product_ids)
     )
     return prices
 
@@ -1,19 +1,48 @@
+import logging
+from functools import lru_cache
+
 import stripe
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.http import HttpResponse
+from django.utils.module_loading import import_string
 from django.views.decorators.csrf import csrf_exempt
-from django.apps import apps as django_apps
-from django.contrib.contenttypes.models import ContentType
 from drf_stripe.settings import drf_stripe_settings
+from drf_stripe.stripe_api.customers import get_billing_model, resolve_owner_model, \
+    get_owner_fk_attname, model_has_field
+
+logger = logging.getLogger(__name__)
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 ENDPOINT_SECRET = settings.STRIPE_WEBHOOK_SECRET
 
+# events that may carry a subscription id to persist on a BillingAccount
+BILLING_EVENT_TYPES = (
+    "checkout.session.completed", "invoice.payment_succeeded",
+    "customer.subscription.created", "customer.subscription.updated"
+)
+
+# Stripe-Signature headers hold a timestamp and a few signatures, anything much longer is not from Stripe.
+MAX_SIGNATURE_HEADER_LENGTH = 1024
+
+
+def _is_well_formed_signature_header(sig_header):
+    """
+    Cheap check that a Stripe-Signature header has a timestamp and a v1 signature,
+    so that malformed requests are rejected before computing the HMAC of the payload.
+    """
+    if not sig_header or len(sig_header) > MAX_SIGNATURE_HEADER_LENGTH:
+        return False
+    elements = sig_header.split(",")
+    return any(e.startswith("t=") for e in elements) and any(e.startswith("v1=") for e in elements)
+
 
 @csrf_exempt
 def stripe_webhook(request):
     payload = request.body
     sig_header = request.META.get("HTTP_STRIPE_SIGNATURE", "")
+    if not _is_well_formed_signature_header(sig_header):
+        return HttpResponse(status=400)
     try:
         event = stripe.Webhook.construct_event(payload, sig_header, ENDPOINT_SECRET)
     except Exception:
@@ -23,77 +52,74 @@ def stripe_webhook(request):
     obj = event['data'].get('object') or {}
 
     # Only attempt billing-account mapping if user enabled BILLING_ACCOUNT_MODEL
-    BillingModelPath = drf_stripe_settings.BILLING_ACCOUNT_MODEL
-    BillingModel = None
-    if BillingModelPath:
+    if typ in BILLING_EVENT_TYPES and drf_stripe_settings.BILLING_ACCOUNT_MODEL:
+        metadata = obj.get("metadata", {}) or {}
+        data = {
+            "owner_type": metadata.get("owner_type"),
+            "owner_id": metadata.get("owner_id"),
+            "subscription_id": obj.get("subscription") or obj.get("id"),
+            "customer_id": obj.get("customer"),
+        }
+        task_path = drf_stripe_settings.BILLING_WEBHOOK_TASK
+        if task_path:
+            _get_billing_webhook_task(task_path)(data)
+        else:
+            map_billing_account(data)
+
+    return HttpResponse(status=200)
+
+
+@lru_cache(maxsize=None)
+def _get_billing_webhook_task(task_path):
+    return import_string(task_path)
+
+
+def map_billing_account(data):
+    """
+    Persist the subscription id of a billing webhook event on its BillingAccount.
+    The billing account is found with the owner_type/owner_id checkout metadata first, then by Stripe customer id.
+
+    Called by stripe_webhook, or by the callable configured in BILLING_WEBHOOK_TASK from a background worker.
+
+    :param dict data: dict with keys owner_type, owner_id, subscription_id and customer_id, any of which may be None.
+    """
+    BillingModel = get_billing_model()
+    if not BillingModel:
+        return
+
+    owner_type = data.get("owner_type")
+    owner_id = data.get("owner_id")
+    subscription_id = data.get("subscription_id")
+    customer_id = data.get("customer_id")
+
+    # only the column written below is loaded
+    billing_accounts = BillingModel.objects.only("pk", "stripe_subscription_id")
+    ba = None
+    # Try metadata mapping first
+    if owner_type and owner_id:
         try:
-            app_label, model_name = BillingModelPath.split('.', 1)
-            BillingModel = django_apps.get_model(app_label, model_name)
+            owner_cls = resolve_owner_model(owner_type)
+            # If BillingModel uses Generic relation, find by content_type/object_id
+            if hasattr(BillingModel, 'content_type') and owner_cls and owner_cls.objects.filter(pk=owner_id).exists():
+                ct = ContentType.objects.get_for_model(owner_cls)
+                ba = billing_accounts.filter(content_type=ct, object_id=owner_id).first()
+            elif owner_cls:
+                # Otherwise find by the FK referencing the owner model
+                owner_fk_attname = get_owner_fk_attname(BillingModel, owner_cls)
+                if owner_fk_attname:
+                    ba = billing_accounts.filter(**{owner_fk_attname: owner_id}).first()
         except Exception:
-            try:
-                BillingModel = django_apps.get_model(BillingModelPath)
-            except Exception:
-                BillingModel = None
+            ba = None
 
-    # events that may carry subscription id
-    if typ in ("checkout.session.completed", "invoice.payment_succeeded", "customer.subscription.created", "customer.subscription.updated"):
-        metadata = obj.get("metadata", {}) or {}
-        owner_type = metadata.get("owner_type")
-        owner_id = metadata.get("owner_id")
-        subscription_id = obj.get("subscription") or obj.get("id")
-        customer_id = obj.get("customer")
-
-        ba = None
-        if BillingModel:
-            # Try metadata mapping first
-            if owner_type and owner_id:
-                try:
-                    target_owner = None
-                    if '.' in owner_type:
-                        owner_app_label, owner_model = owner_type.split('.', 1)
-                        owner_cls = django_apps.get_model(owner_app_label, owner_model)
-                        target_owner = owner_cls.objects.filter(pk=owner_id).first()
-                    else:
-                        owner_cls = None
-                        for app_config in django_apps.get_app_configs():
-                            try:
-                                owner_cls = django_apps.get_model(app_config.label, owner_type)
-                                break
-                            except Exception:
-                                continue
-                        if owner_cls:
-                            target_owner = owner_cls.objects.filter(pk=owner_id).first()
-
-                    # If BillingModel uses Generic relation, find by content_type/object_id
-                    if hasattr(BillingModel, 'content_type') and target_owner:
-                        ct = ContentType.objects.get_for_model(target_owner.__class__)
-                        ba = BillingModel.objects.filter(content_type=ct, object_id=target_owner.pk).first()
-                    else:
-                        # Try common FK names referencing owner
-                        for field_name in ('owner', 'user', 'organization', 'team'):
-                            try:
-                                filter_kwargs = {f"{field_name}__pk": owner_id}
-                                ba = BillingModel.objects.filter(**filter_kwargs).first()
-                                if ba:
-                                    break
-                            except Exception:
-                                continue
-                except Exception:
-                    ba = None
-
-            # fallback: try by stripe customer id
-            if not ba and customer_id:
-                try:
-                    ba = BillingModel.objects.filter(stripe_customer_id=customer_id).first()
-                except Exception:
-                    ba = None
-
-        # If a billing-account instance is found and subscription id is present, persist it.
-        if ba and subscription_id:
-            try:
-                ba.stripe_subscription_id = subscription_id
-                ba.save(update_fields=["stripe_subscription_id"])
-            except Exception:
-                pass
+    # fallback: try by stripe customer id
+    if ba is None and customer_id and model_has_field(BillingModel, "stripe_customer_id"):
+        ba = billing_accounts.filter(stripe_customer_id=customer_id).first()
 
-    return HttpResponse(status=200)
+    # If a billing-account instance is found and subscription id is present, persist it.
+    # save() rather than update(), so the billing model's save() and signals run.
+    if ba and subscription_id:
+        try:
+            ba.stripe_subscription_id = subscription_id
+            ba.save(update_fields=["stripe_subscription_id"])
+        except Exception:
+            logger.exception("Could not save subscription id %s on billing account %s", subscription_id, ba.pk)
@@ -1,59 +1,146 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError
+from django.db.models import Q
+from django.db.transaction import atomic
+
 from drf_stripe.models import Subscription, SubscriptionItem, StripeUser
-from drf_stripe.stripe_api.customers import get_billing_model, find_billing_account, update_billing_account_subscription
+from drf_stripe.settings import drf_stripe_settings
 from drf_stripe.stripe_models.event import StripeSubscriptionEventData
 
 
-def _handle_customer_subscription_event_data(data: StripeSubscriptionEventData):
-    subscription_id = data.object.id
-    customer = data.object.customer
-    period_start = data.object.current_period_start
-    period_end = data.object.current_period_end
-    cancel_at_period_end = data.object.cancel_at_period_end
-    cancel_at = data.object.cancel_at
-    ended_at = data.object.ended_at
-    status = data.object.status
-    trial_end = data.object.trial_end
-    trial_start = data.object.trial_start
+BILLING_ACCOUNT_SUBSCRIPTION_FIELDS = ["stripe_customer_id", "stripe_subscription_id"]
+
 
-    stripe_user = StripeUser.objects.get(customer_id=customer)
+@atomic
+def _handle_customer_subscription_event_data(data: StripeSubscriptionEventData, changed_billing_accounts=None,
+                                             stripe_user_ids=None):
+    """
+    :param data: subscription event data
+    :param changed_billing_accounts: optional dict, when given the billing accounts changed by the event are
+        collected in it by pk instead of being saved, so a batch of events can save them with one bulk_update.
+    :param stripe_user_ids: optional dict of StripeUser ids by customer id, already locked with _lock_stripe_user_ids()
+    """
+    subscription = data.object
+    subscription_id = subscription.id
+    customer = subscription.customer
+
+    if stripe_user_ids is not None and customer in stripe_user_ids:
+        stripe_user_id = stripe_user_ids[customer]
+    else:
+        # lock the customer's StripeUser so concurrent events for the same customer are applied one at a time,
+        # only its primary key, the user id, is needed
+        stripe_user_id = StripeUser.objects.select_for_update().values_list("user_id", flat=True).get(customer_id=customer)
 
     subscription_defaults = {
-        "stripe_user": stripe_user,
-        "period_start": period_start,
-        "period_end": period_end,
-        "cancel_at": cancel_at,
-        "cancel_at_period_end": cancel_at_period_end,
-        "ended_at": ended_at,
-        "status": status,
-        "trial_end": trial_end,
-        "trial_start": trial_start
+        "stripe_user_id": stripe_user_id,
+        "period_start": subscription.current_period_start,
+        "period_end": subscription.current_period_end,
+        "cancel_at": subscription.cancel_at,
+        "cancel_at_period_end": subscription.cancel_at_period_end,
+        "ended_at": subscription.ended_at,
+        "status": subscription.status,
+        "trial_end": subscription.trial_end,
+        "trial_start": subscription.trial_start
     }
 
-    # Link to billing account if configured
-    billing_model = get_billing_model()
-    if billing_model:
-        user = stripe_user.user if stripe_user else None
-        billing_account = find_billing_account(billing_model, customer_id=customer, user=user)
-        subscription_defaults = update_billing_account_subscription(
-            billing_model, billing_account, customer, subscription_id, subscription_defaults
-        )
-
-    subscription, created = Subscription.objects.update_or_create(
-        subscription_id=subscription_id,
-        defaults=subscription_defaults
+    # Link to billing account if configured; the billing account helpers are only imported when one is
+    if drf_stripe_settings.BILLING_ACCOUNT_MODEL:
+        from drf_stripe.stripe_api.customers import get_billing_model, find_billing_account, \
+            update_billing_account_subscription, set_billing_account_subscription_fields
+        billing_model = get_billing_model()
+        billing_account = find_billing_account(billing_model, customer_id=customer, user=stripe_user_id)
+        if changed_billing_accounts is None:
+            subscription_defaults = update_billing_account_subscription(
+                billing_model, billing_account, customer, subscription_id, subscription_defaults
+            )
+        elif billing_account:
+            # continue from the pending changes if an earlier event of the batch changed this billing account
+            billing_account = changed_billing_accounts.get(billing_account.pk, billing_account)
+            if set_billing_account_subscription_fields(billing_account, customer, subscription_id):
+                changed_billing_accounts[billing_account.pk] = billing_account
+            subscription_defaults["billing_account_content_type_id"] = ContentType.objects.get_for_model(billing_model).pk
+            subscription_defaults["billing_account_object_id"] = billing_account.pk
+
+    _update_or_create_subscription(subscription_id, subscription_defaults)
+    _update_subscription_items(data)
+
+
+def _lock_stripe_user_ids(customer_ids):
+    """
+    Lock the StripeUsers of many customers with one query, as _handle_customer_subscription_event_data
+    does for a single event, returning their ids by customer id.
+
+    :param customer_ids: Stripe customer ids
+    """
+    return dict(
+        StripeUser.objects.select_for_update().filter(customer_id__in=customer_ids).values_list("customer_id", "user_id")
     )
 
-    subscription.items.all().delete()
-    _create_subscription_items(data)
 
+def _save_billing_accounts(billing_accounts):
+    """Save the subscription fields of billing accounts collected by _handle_customer_subscription_event_data."""
+    billing_accounts = list(billing_accounts)
+    if billing_accounts:
+        type(billing_accounts[0]).objects.bulk_update(billing_accounts, BILLING_ACCOUNT_SUBSCRIPTION_FIELDS)
+
+
+def _update_or_create_subscription(subscription_id, subscription_defaults):
+    """
+    Update the Subscription with a single UPDATE, only inserting it when it does not exist yet.
+    Most events are for existing subscriptions, which saves the SELECT done by update_or_create().
+    """
+    if Subscription.objects.filter(subscription_id=subscription_id).update(**subscription_defaults):
+        return
+    try:
+        with atomic():
+            Subscription.objects.create(subscription_id=subscription_id, **subscription_defaults)
+    except IntegrityError:
+        # created by a concurrent event in the meantime
+        Subscription.objects.filter(subscription_id=subscription_id).update(**subscription_defaults)
+
+
+def _update_subscription_items(data: StripeSubscriptionEventData):
+    """
+    Make the SubscriptionItems of the subscription match the event, writing only what changed:
+    items no longer on the subscription are deleted, changed items are updated and new items are inserted.
+    An event that leaves the items unchanged, ie: a renewal, does not write any SubscriptionItem.
+    """
+    subscription = data.object
+    subscription_id = subscription.id
+    incoming = {item.id: item for item in subscription.items.data}
+
+    # also load incoming items recorded on another subscription, so they are moved rather than inserted twice
+    current = {
+        item.sub_item_id: item for item in SubscriptionItem.objects.filter(
+            Q(subscription_id=subscription_id) | Q(sub_item_id__in=incoming.keys())
+        ).only("sub_item_id", "subscription_id", "price_id", "quantity")
+    }
+
+    stale_ids = [
+        sub_item_id for sub_item_id, item in current.items()
+        if sub_item_id not in incoming and item.subscription_id == subscription_id
+    ]
+    if stale_ids:
+        SubscriptionItem.objects.filter(sub_item_id__in=stale_ids).delete()
+
+    to_create = []
+    to_update = []
+    for sub_item_id, item_data in incoming.items():
+        item = current.get(sub_item_id)
+        if item is None:
+            to_create.append(SubscriptionItem(
+                sub_item_id=sub_item_id,
+                subscription_id=subscription_id,
+                price_id=item_data.price.id,
+                quantity=item_data.quantity
+            ))
+        elif (item.subscription_id, item.price_id, item.quantity) != (subscription_id, item_data.price.id, item_data.quantity):
+            item.subscription_id = subscription_id
+            item.price_id = item_data.price.id
+            item.quantity = item_data.quantity
+            to_update.append(item)
 
-def _create_subscription_items(data: StripeSubscriptionEventData):
-    for item in data.object.items.data:
-        SubscriptionItem.objects.update_or_create(
-            sub_item_id=item.id,
-            defaults={
-                "subscription_id": data.object.id,
-                "price_id": item.price.id,
-                "quantity": item.quantity
-            }
-        )
+    if to_update:
+        SubscriptionItem.objects.bulk_update(to_update, ["subscription", "price", "quantity"])
+    if to_create:
+        SubscriptionItem.objects.bulk_create(to_create)
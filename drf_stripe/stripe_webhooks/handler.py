@@ -1,14 +1,23 @@
+from django.db.transaction import atomic
 from pydantic import ValidationError
 from rest_framework.request import Request
 
+from drf_stripe.models import StripeUser
 from drf_stripe.settings import drf_stripe_settings
 from drf_stripe.stripe_api.api import stripe_api as stripe
 from drf_stripe.stripe_models.event import EventType
 from drf_stripe.stripe_models.event import StripeEvent
-from .customer_subscription import _handle_customer_subscription_event_data
+from .customer_subscription import _handle_customer_subscription_event_data, _lock_stripe_user_ids, \
+    _save_billing_accounts
 from .price import _handle_price_event_data
 from .product import _handle_product_event_data
 
+SUBSCRIPTION_EVENT_TYPES = (
+    EventType.CUSTOMER_SUBSCRIPTION_CREATED,
+    EventType.CUSTOMER_SUBSCRIPTION_UPDATED,
+    EventType.CUSTOMER_SUBSCRIPTION_DELETED,
+)
+
 
 def handle_stripe_webhook_request(request):
     event = _make_webhook_event_from_request(request)
@@ -46,15 +55,72 @@ def _handle_event_type_validation_error(err: ValidationError):
         raise err
 
 
-def handle_webhook_event(event):
-    """Perform actions given Stripe Webhook event data."""
-
+def _parse_webhook_event(event):
+    """Parse Stripe Webhook event data, returns None for unimplemented event types."""
     try:
-        e = StripeEvent(event=event)
+        return StripeEvent(event=event)
     except ValidationError as err:
         _handle_event_type_validation_error(err)
-        return
+        return None
+
+
+def handle_webhook_event(event):
+    """Perform actions given Stripe Webhook event data."""
+
+    e = _parse_webhook_event(event)
+    if e is not None:
+        _handle_parsed_event(e)
 
+
+def handle_webhook_events(events):
+    """
+    Perform actions given many Stripe Webhook events, ie: a batch drained from a task queue, in one transaction.
+    Subscription events carry the whole subscription, so only the most recent event for each subscription,
+    by its "created" timestamp, is applied, and the billing accounts they change are saved with one bulk_update.
+    Product and price events are applied first, in order, so that subscription items can reference
+    prices created in the same batch.
+
+    Each subscription is applied in its own savepoint: an event whose customer has no StripeUser is rolled back
+    and returned, so the caller can retry it, while the rest of the batch is committed. Any other error rolls
+    back the whole batch.
+
+    :param events: Stripe Webhook event data, in the order they were received.
+    :return: the subscription events that were skipped because their customer has no StripeUser.
+    """
+    other_events = []
+    latest_subscription_events = {}
+    for event in events:
+        e = _parse_webhook_event(event)
+        if e is None:
+            continue
+        if e.event.type in SUBSCRIPTION_EVENT_TYPES:
+            # Stripe does not guarantee delivery order, so keep the newest event, the later one on a tie
+            subscription_id = e.event.data.object.id
+            created = event.get("created", 0)
+            latest = latest_subscription_events.get(subscription_id)
+            if latest is None or created >= latest[0]:
+                latest_subscription_events[subscription_id] = (created, event, e)
+        else:
+            other_events.append(e)
+
+    changed_billing_accounts = {}
+    failed_events = []
+    with atomic():
+        for e in other_events:
+            _handle_parsed_event(e)
+        stripe_user_ids = _lock_stripe_user_ids(
+            {e.event.data.object.customer for _, _, e in latest_subscription_events.values()}
+        )
+        for _, event, e in latest_subscription_events.values():
+            try:
+                _handle_customer_subscription_event_data(e.event.data, changed_billing_accounts, stripe_user_ids)
+            except StripeUser.DoesNotExist:
+                failed_events.append(event)
+        _save_billing_accounts(changed_billing_accounts.values())
+    return failed_events
+
+
+def _handle_parsed_event(e: StripeEvent):
     event_type = e.event.type
 
     if event_type is EventType.CUSTOMER_SUBSCRIPTION_CREATED:
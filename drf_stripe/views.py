@@ -4,7 +4,8 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from drf_stripe.stripe_webhooks.handler import handle_stripe_webhook_request
-from .serializers import SubscriptionSerializer, PriceSerializer, SubscriptionItemSerializer, CheckoutRequestSerializer
+from .serializers import SubscriptionSerializer, PriceSerializer, SubscriptionItemSerializer, CheckoutRequestSerializer, \
+    prefetch_product_features
 from .stripe_api.customer_portal import stripe_api_create_billing_portal_session
 from .stripe_api.subscriptions import list_user_subscriptions, list_user_subscription_items, \
     list_subscribable_product_prices_to_user, list_all_available_product_prices
@@ -27,7 +28,16 @@ class SubscriptionItems(ListAPIView):
     pagination_class = None
 
     def get_queryset(self):
-        return list_user_subscription_items(self.request.user.id)
+        return list_user_subscription_items(self.request.user.id).select_related(
+            "subscription", "price__product"
+        ).only(
+            "sub_item_id", "subscription", "price",
+            "subscription__status", "subscription__period_start", "subscription__period_end",
+            "subscription__trial_start", "subscription__trial_end", "subscription__ended_at",
+            "subscription__cancel_at", "subscription__cancel_at_period_end",
+            "price__price_id", "price__nickname", "price__price", "price__freq", "price__product",
+            "price__product__product_id", "price__product__name", "price__product__description",
+        ).prefetch_related(prefetch_product_features("price__product__linked_features"))
 
 
 class SubscribableProductPrice(ListAPIView):
@@ -44,9 +54,10 @@ class SubscribableProductPrice(ListAPIView):
 
     def get_queryset(self):
         if self.request.user.is_anonymous:
-            return list_all_available_product_prices()
+            prices = list_all_available_product_prices()
         else:
-            return list_subscribable_product_prices_to_user(self.request.user.id)
+            prices = list_subscribable_product_prices_to_user(self.request.user.id)
+        return prices.select_related("product").prefetch_related(prefetch_product_features("product__linked_features"))
 
 
 class CreateStripeCheckoutSession(APIView):
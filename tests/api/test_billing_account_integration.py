@@ -1,44 +1,38 @@
 """Tests for billing account integration with pull_stripe command."""
-from unittest.mock import patch
-
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
-from django.test import TestCase, override_settings
+from django.test import override_settings
 
 from drf_stripe.models import Subscription, StripeUser
-from drf_stripe.settings import drf_stripe_settings
 from drf_stripe.stripe_api.customers import stripe_api_update_customers
 from drf_stripe.stripe_api.subscriptions import stripe_api_update_subscriptions
 from tests.base import BaseTest
+from tests.mixins import BillingAccountTestMixin
 from tests.models import CustomBilling
 
 
-class TestBillingAccountIntegration(BaseTest):
+class TestBillingAccountIntegration(BillingAccountTestMixin, BaseTest):
     """Test that pull_stripe updates billing account fields correctly."""
 
-    def setUp(self) -> None:
-        self.setup_product_prices()
+    @classmethod
+    def setUpTestData(cls):
+        cls.setup_product_prices()
         # Create a user and a custom billing account with that user as manager
-        self.user = get_user_model().objects.create(
+        cls.user = get_user_model().objects.create(
             username="tester",
             email="tester1@example.com",
             password="12345"
         )
-        self.custom_billing = CustomBilling.objects.create(
+        cls.custom_billing = CustomBilling.objects.create(
             name="Test CustomBilling",
-            manager_user=self.user
+            manager_user=cls.user
         )
         # Create StripeUser for the test user
-        self.stripe_user = StripeUser.objects.create(
-            user_id=self.user.id,
+        cls.stripe_user = StripeUser.objects.create(
+            user_id=cls.user.id,
             customer_id="cus_tester"
         )
-
-    def get_billing_settings(self):
-        """Return DRF_STRIPE settings with BILLING_ACCOUNT_MODEL configured."""
-        settings_copy = dict(drf_stripe_settings.user_settings)
-        settings_copy['BILLING_ACCOUNT_MODEL'] = 'tests.CustomBilling'
-        return settings_copy
+        cls.custom_billing_ct = ContentType.objects.get_for_model(CustomBilling)
 
     def test_update_subscriptions_links_to_billing_account_by_manager_user(self):
         """
@@ -46,8 +40,6 @@ class TestBillingAccountIntegration(BaseTest):
         when BILLING_ACCOUNT_MODEL is configured and custom billing has manager_user.
         """
         with override_settings(DRF_STRIPE=self.get_billing_settings()):
-            drf_stripe_settings.reload()
-
             response = self._load_test_data("v1/api_subscription_list.json")
             # Only use the first subscription (for cus_tester)
             response['data'] = [response['data'][0]]
@@ -55,20 +47,17 @@ class TestBillingAccountIntegration(BaseTest):
             stripe_api_update_subscriptions(test_data=response)
 
             # Check that subscription was created and linked to billing account
-            subscription = Subscription.objects.get(subscription_id="sub_0001")
-            self.assertEqual(subscription.stripe_user.customer_id, "cus_tester")
+            subscription = Subscription.objects.filter(subscription_id="sub_0001").values(
+                "stripe_user__customer_id", "billing_account_content_type_id", "billing_account_object_id"
+            ).get()
+            self.assertEqual(subscription["stripe_user__customer_id"], "cus_tester")
 
             # Check that billing account content type and object id are set
-            custom_billing_ct = ContentType.objects.get_for_model(CustomBilling)
-            self.assertEqual(subscription.billing_account_content_type, custom_billing_ct)
-            self.assertEqual(subscription.billing_account_object_id, self.custom_billing.pk)
+            self.assertEqual(subscription["billing_account_content_type_id"], self.custom_billing_ct.pk)
+            self.assertEqual(subscription["billing_account_object_id"], self.custom_billing.pk)
 
             # Check that billing account fields are updated
-            self.custom_billing.refresh_from_db()
-            self.assertEqual(self.custom_billing.stripe_customer_id, "cus_tester")
-            self.assertEqual(self.custom_billing.stripe_subscription_id, "sub_0001")
-
-            drf_stripe_settings.reload()
+            self.assertEqual(self.get_billing_stripe_ids(), ("cus_tester", "sub_0001"))
 
     def test_update_subscriptions_links_by_stripe_customer_id(self):
         """
@@ -80,8 +69,6 @@ class TestBillingAccountIntegration(BaseTest):
         self.custom_billing.save()
 
         with override_settings(DRF_STRIPE=self.get_billing_settings()):
-            drf_stripe_settings.reload()
-
             response = self._load_test_data("v1/api_subscription_list.json")
             response['data'] = [response['data'][0]]
 
@@ -89,15 +76,11 @@ class TestBillingAccountIntegration(BaseTest):
 
             # Check that subscription was linked to billing account
             subscription = Subscription.objects.get(subscription_id="sub_0001")
-            custom_billing_ct = ContentType.objects.get_for_model(CustomBilling)
-            self.assertEqual(subscription.billing_account_content_type, custom_billing_ct)
+            self.assertEqual(subscription.billing_account_content_type, self.custom_billing_ct)
             self.assertEqual(subscription.billing_account_object_id, self.custom_billing.pk)
 
             # Check that stripe_subscription_id is updated
-            self.custom_billing.refresh_from_db()
-            self.assertEqual(self.custom_billing.stripe_subscription_id, "sub_0001")
-
-            drf_stripe_settings.reload()
+            self.assertEqual(self.get_billing_stripe_ids()[1], "sub_0001")
 
     def test_update_customers_updates_billing_account_stripe_customer_id(self):
         """
@@ -109,8 +92,6 @@ class TestBillingAccountIntegration(BaseTest):
         self.custom_billing.save()
 
         with override_settings(DRF_STRIPE=self.get_billing_settings()):
-            drf_stripe_settings.reload()
-
             response = self._load_test_data("v1/api_customer_list_2_items.json")
             # Only use the first customer (tester1@example.com)
             response['data'] = [response['data'][0]]
@@ -118,10 +99,7 @@ class TestBillingAccountIntegration(BaseTest):
             stripe_api_update_customers(test_data=response)
 
             # Check that billing account stripe_customer_id is updated
-            self.custom_billing.refresh_from_db()
-            self.assertEqual(self.custom_billing.stripe_customer_id, "cus_tester")
-
-            drf_stripe_settings.reload()
+            self.assertEqual(self.get_billing_stripe_ids()[0], "cus_tester")
 
     def test_update_subscriptions_without_billing_model_works_as_before(self):
         """
@@ -134,14 +112,14 @@ class TestBillingAccountIntegration(BaseTest):
         stripe_api_update_subscriptions(test_data=response)
 
         # Check that subscription was created
-        subscription = Subscription.objects.get(subscription_id="sub_0001")
-        self.assertEqual(subscription.stripe_user.customer_id, "cus_tester")
+        subscription = Subscription.objects.filter(subscription_id="sub_0001").values(
+            "stripe_user__customer_id", "billing_account_content_type_id", "billing_account_object_id"
+        ).get()
+        self.assertEqual(subscription["stripe_user__customer_id"], "cus_tester")
 
         # Check that billing account fields are NOT set (legacy behavior)
-        self.assertIsNone(subscription.billing_account_content_type)
-        self.assertIsNone(subscription.billing_account_object_id)
+        self.assertIsNone(subscription["billing_account_content_type_id"])
+        self.assertIsNone(subscription["billing_account_object_id"])
 
         # CustomBilling should not be updated
-        self.custom_billing.refresh_from_db()
-        self.assertIsNone(self.custom_billing.stripe_customer_id)
-        self.assertIsNone(self.custom_billing.stripe_subscription_id)
+        self.assertEqual(self.get_billing_stripe_ids(), (None, None))
@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from drf_stripe.stripe_api.customers import resolve_owner_model, get_billing_model_options, get_owner_fk_attname, \
+    model_has_field, find_billing_account, get_billing_model, _resolve_billing_model
+from tests.models import CustomBilling, GenericBilling, OwnedBilling
+
+
+class TestResolveOwnerModel(TestCase):
+
+    def test_resolve_dotted_owner_type(self):
+        self.assertIs(resolve_owner_model("tests.CustomBilling"), CustomBilling)
+
+    def test_resolve_bare_owner_type(self):
+        self.assertIs(resolve_owner_model("user"), get_user_model())
+        self.assertIs(resolve_owner_model("custombilling"), CustomBilling)
+        self.assertIs(resolve_owner_model("CustomBilling"), CustomBilling)
+
+    def test_resolve_unknown_owner_type(self):
+        self.assertIsNone(resolve_owner_model("doesnotexist"))
+
+
+class TestOwnerForeignKey(TestCase):
+
+    def test_owner_fk_attname(self):
+        self.assertEqual(get_owner_fk_attname(OwnedBilling, get_user_model()), "owner_id")
+
+    def test_owner_fk_attname_ignores_manager_user(self):
+        self.assertIsNone(get_owner_fk_attname(CustomBilling, get_user_model()))
+
+    def test_owner_fk_attname_without_foreign_key(self):
+        self.assertIsNone(get_owner_fk_attname(CustomBilling, GenericBilling))
+
+
+class TestModelHasField(TestCase):
+
+    def test_model_has_field(self):
+        self.assertTrue(model_has_field(CustomBilling, "stripe_customer_id"))
+        self.assertFalse(model_has_field(get_user_model(), "stripe_customer_id"))
+
+    def test_find_billing_account_on_model_without_billing_fields(self):
+        user = get_user_model().objects.create(username="tester", email="tester@example.com")
+        self.assertIsNone(find_billing_account(get_user_model(), customer_id="cus_tester", user=user))
+
+
+class TestBillingModelOptions(TestCase):
+
+    def test_billing_model_not_configured(self):
+        self.assertEqual(get_billing_model_options(), (None, False, None))
+
+    def test_billing_model_options(self):
+        with override_settings(DRF_STRIPE={"BILLING_ACCOUNT_MODEL": "tests.GenericBilling"}):
+            self.assertEqual(get_billing_model_options(), (GenericBilling, True, 'owner'))
+        self.assertEqual(get_billing_model_options(), (None, False, None))
+
+
+class TestGetBillingModel(TestCase):
+
+    def test_get_billing_model_is_cached_per_path(self):
+        self.assertIsNone(get_billing_model())
+        with override_settings(DRF_STRIPE={"BILLING_ACCOUNT_MODEL": "tests.GenericBilling"}):
+            self.assertIs(get_billing_model(), GenericBilling)
+            hits = _resolve_billing_model.cache_info().hits
+            self.assertIs(get_billing_model(), GenericBilling)
+            self.assertEqual(_resolve_billing_model.cache_info().hits, hits + 1)
+        self.assertIsNone(get_billing_model())
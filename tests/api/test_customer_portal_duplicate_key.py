@@ -1,7 +1,9 @@
-from unittest.mock import patch, MagicMock
+from types import SimpleNamespace
+from unittest.mock import patch
+
 from drf_stripe.models import get_drf_stripe_user_model as get_user_model
 from drf_stripe.models import StripeUser
-from drf_stripe.stripe_api.customers import get_or_create_stripe_user
+from drf_stripe.stripe_api.customers import get_or_create_stripe_user, _get_or_create_stripe_user_from_user_id_email
 from ..base import BaseTest
 
 
@@ -18,9 +20,7 @@ class TestCustomerPortalDuplicateKey(BaseTest):
         accesses the customer portal, which should work without errors.
         """
         # Mock the Stripe API response
-        mock_customer = MagicMock()
-        mock_customer.id = "cus_test123"
-        mock_stripe_customer.return_value = mock_customer
+        mock_stripe_customer.return_value = SimpleNamespace(id="cus_test123")
         
         # Create a test user
         user = get_user_model().objects.create(username="test_user", email="test@example.com")
@@ -65,3 +65,16 @@ class TestCustomerPortalDuplicateKey(BaseTest):
         # Verify there's still only one StripeUser
         stripe_user_count = StripeUser.objects.filter(user_id=user.id).count()
         self.assertEqual(stripe_user_count, 1)
+
+    @patch('drf_stripe.stripe_api.customers._stripe_api_get_or_create_customer_from_email')
+    def test_get_or_create_stripe_user_with_known_customer_id(self, mock_stripe_customer):
+        """
+        Test that a known customer id is stored on an existing StripeUser without searching Stripe for one.
+        """
+        user = get_user_model().objects.create(username="no_customer", email="no_customer@example.com")
+        StripeUser.objects.create(user_id=user.id)
+
+        _get_or_create_stripe_user_from_user_id_email(user.id, user.email, "cus_known")
+
+        self.assertEqual(StripeUser.objects.get(user_id=user.id).customer_id, "cus_known")
+        mock_stripe_customer.assert_not_called()
@@ -1,6 +1,12 @@
+from io import StringIO
+from unittest.mock import patch, MagicMock
+
+from django.core.management import call_command
+
 from drf_stripe.models import get_drf_stripe_user_model as get_user_model
 
 from drf_stripe.models import StripeUser
+from drf_stripe.stripe_api.api import iter_list_chunks
 from drf_stripe.stripe_api.customers import stripe_api_update_customers
 from ..base import BaseTest
 
@@ -20,7 +26,7 @@ class TestCustomer(BaseTest):
         
         response = self._load_test_data("v1/api_customer_list_2_items.json")
 
-        stripe_api_update_customers(test_data=response)
+        self.assertEqual(stripe_api_update_customers(test_data=response), (2, 2))
 
         user_1 = get_user_model().objects.get(email="tester1@example.com")
         stripe_user_1 = StripeUser.objects.get(user=user_1)
@@ -38,8 +44,8 @@ class TestCustomer(BaseTest):
         """
         Test retrieving list of customers from Stripe when setting USER_CREATE_DEFAULTS_ATTRIBUTE_MAP is None - Django User should not be created.
         """
-        drf_stripe_copy = drf_stripe_settings.user_settings
-        drf_stripe_copy['USER_CREATE_DEFAULTS_ATTRIBUTE_MAP'] = None
+        # copy the user settings, so the override does not leak into settings.DRF_STRIPE
+        drf_stripe_copy = {**drf_stripe_settings.user_settings, 'USER_CREATE_DEFAULTS_ATTRIBUTE_MAP': None}
         with override_settings(DRF_STRIPE=drf_stripe_copy):
             response = self._load_test_data("v1/api_customer_list_2_items.json")
 
@@ -60,3 +66,47 @@ class TestCustomer(BaseTest):
         self.assertIsNone(user_3)
         stripe_user_3 = StripeUser.objects.filter(customer_id="cus_tester3").first()
         self.assertIsNone(stripe_user_3)
+
+    @patch("drf_stripe.stripe_api.customers.stripe.Customer.list")
+    def test_update_customers_all_pages(self, mock_customer_list):
+        """
+        Test retrieving every page of customers from Stripe with auto pagination.
+        """
+        response = self._load_test_data("v1/api_customer_list_2_items.json")
+        list_response = MagicMock()
+        list_response.auto_paging_iter.return_value = iter(response["data"])
+        mock_customer_list.return_value = list_response
+
+        stripe_api_update_customers(all_pages=True)
+
+        mock_customer_list.assert_called_once_with(limit=100, starting_after=None)
+        self.assertEqual(
+            set(StripeUser.objects.values_list("customer_id", flat=True)), {"cus_tester", "cus_tester2", "cus_tester3"}
+        )
+
+    def test_update_customers_does_not_count_conflicting_stripe_users(self):
+        """
+        Test that StripeUsers skipped by ignore_conflicts, ie: created concurrently, are not counted as linked.
+        """
+        response = self._load_test_data("v1/api_customer_list_2_items.json")
+
+        # the StripeUser of tester1 is not seen before the insert, as if it had been created concurrently
+        with patch.object(StripeUser.objects, "in_bulk", return_value={}):
+            self.assertEqual(stripe_api_update_customers(test_data=response), (2, 2))
+
+    @patch("drf_stripe.stripe_api.customers.stripe.Customer.list")
+    def test_update_stripe_customers_command_writes_counts(self, mock_customer_list):
+        """
+        Test that the update_stripe_customers management command writes the sync counts to stdout.
+        """
+        mock_customer_list.return_value = self._load_test_data("v1/api_customer_list_2_items.json")
+
+        out = StringIO()
+        call_command("update_stripe_customers", stdout=out)
+
+        self.assertIn("2 user(s) created, 2 user(s) linked to Stripe customers.", out.getvalue())
+
+    def test_iter_list_chunks(self):
+        list_response = MagicMock()
+        list_response.auto_paging_iter.return_value = iter(range(5))
+        self.assertEqual(list(iter_list_chunks(list_response, chunk_size=2)), [[0, 1], [2, 3], [4]])
@@ -53,8 +53,8 @@ class TestSubscription(BaseTest):
         """
         Test retrieving list of subscription from Stripe and update database without creating django users if they don't already exist.
         """
-        drf_stripe_copy = drf_stripe_settings.user_settings
-        drf_stripe_copy['USER_CREATE_DEFAULTS_ATTRIBUTE_MAP'] = None
+        # copy the user settings, so the override does not leak into settings.DRF_STRIPE
+        drf_stripe_copy = {**drf_stripe_settings.user_settings, 'USER_CREATE_DEFAULTS_ATTRIBUTE_MAP': None}
         with override_settings(DRF_STRIPE=drf_stripe_copy):
             response = self._load_test_data("v1/api_subscription_list.json")
 
@@ -1,6 +1,10 @@
 import json
+from copy import deepcopy
+from functools import lru_cache
 from pathlib import Path
 
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
 from drf_stripe.models import get_drf_stripe_user_model as get_user_model
 from django.test import TestCase
 
@@ -10,15 +14,22 @@ from drf_stripe.stripe_api.products import stripe_api_update_products_prices
 
 class BaseTest(TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # warm the ContentType cache with one query, so query counts do not depend on test order
+        ContentType.objects.get_for_models(*apps.get_models())
+
     def setUp(self) -> None:
         pass
 
     def tearDown(self) -> None:
         pass
 
-    def setup_product_prices(self):
-        products = self._load_test_data("v1/api_product_list.json")
-        prices = self._load_test_data("v1/api_price_list.json")
+    @classmethod
+    def setup_product_prices(cls):
+        products = cls._load_test_data("v1/api_product_list.json")
+        prices = cls._load_test_data("v1/api_price_list.json")
         stripe_api_update_products_prices(test_products=products, test_prices=prices)
 
     @staticmethod
@@ -29,14 +40,19 @@ class BaseTest(TestCase):
 
     @staticmethod
     def _load_test_data(file_name):
-        p = Path("tests/mock_responses") / file_name
-        with open(p, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        return data
+        # tests mutate the returned data, so hand out a copy of the parsed file
+        return deepcopy(_read_test_data(file_name))
 
     @staticmethod
     def _print(v):
         print("$$$$$$$ DEBUG $$$$$")
         print(v)
         assert False
+
+
+@lru_cache(maxsize=None)
+def _read_test_data(file_name):
+    """Parse a mock response file once per test run."""
+    p = Path("tests/mock_responses") / file_name
+    with open(p, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -0,0 +1,18 @@
+from drf_stripe.settings import drf_stripe_settings
+from tests.models import CustomBilling
+
+
+class BillingAccountTestMixin:
+    """Helpers for tests whose setUpTestData creates a CustomBilling as cls.custom_billing."""
+
+    def get_billing_settings(self):
+        """Return DRF_STRIPE settings with BILLING_ACCOUNT_MODEL configured."""
+        settings_copy = dict(drf_stripe_settings.user_settings)
+        settings_copy['BILLING_ACCOUNT_MODEL'] = 'tests.CustomBilling'
+        return settings_copy
+
+    def get_billing_stripe_ids(self):
+        """Return the (stripe_customer_id, stripe_subscription_id) stored for self.custom_billing."""
+        return CustomBilling.objects.filter(pk=self.custom_billing.pk).values_list(
+            "stripe_customer_id", "stripe_subscription_id"
+        ).get()
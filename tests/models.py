@@ -1,6 +1,8 @@
 """Test models for billing account integration tests."""
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from drf_stripe.models import AbstractBillingAccount
 
 
@@ -13,3 +15,34 @@ class CustomBilling(AbstractBillingAccount):
 
     def __str__(self):
         return self.name
+
+
+class GenericBilling(AbstractBillingAccount):
+    """Test billing model that references its owner through a Generic relation."""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    owner = GenericForeignKey('content_type', 'object_id')
+
+    class Meta:
+        app_label = 'tests'
+        constraints = [
+            models.UniqueConstraint(fields=['content_type', 'object_id'], name='tests_genericbilling_owner')
+        ]
+
+
+class CharGenericBilling(AbstractBillingAccount):
+    """Test billing model whose Generic relation stores the owner id in a CharField, without a unique constraint."""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.CharField(max_length=64)
+    owner = GenericForeignKey('content_type', 'object_id')
+
+    class Meta:
+        app_label = 'tests'
+
+
+class OwnedBilling(AbstractBillingAccount):
+    """Test billing model that references its owner through a foreign key."""
+    owner = models.ForeignKey(get_user_model(), on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        app_label = 'tests'
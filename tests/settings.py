@@ -38,6 +38,10 @@ STATICFILES_FINDERS = (
 
 SECRET_KEY = "1234567890"
 
+# read by drf_stripe.stripe_webhooks.billing
+STRIPE_SECRET_KEY = "sk_test_1234567890"
+STRIPE_WEBHOOK_SECRET = "whsec_1234567890"
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -0,0 +1,37 @@
+from unittest.mock import MagicMock, AsyncMock
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+
+from tests.models import CustomBilling
+
+
+class TestBillingAccountStripeCustomer(TestCase):
+
+    def setUp(self) -> None:
+        self.custom_billing = CustomBilling.objects.create(name="Test CustomBilling")
+
+    def test_get_or_create_stripe_customer(self):
+        stripe_module = MagicMock()
+        stripe_module.Customer.create.return_value = {"id": "cus_tester"}
+
+        customer_id = self.custom_billing.get_or_create_stripe_customer(stripe_module, email="tester1@example.com")
+
+        self.assertEqual(customer_id, "cus_tester")
+        stripe_module.Customer.create.assert_called_once_with(metadata={}, email="tester1@example.com")
+        self.custom_billing.refresh_from_db()
+        self.assertEqual(self.custom_billing.stripe_customer_id, "cus_tester")
+
+    def test_aget_or_create_stripe_customer(self):
+        stripe_module = MagicMock()
+        stripe_module.Customer.create_async = AsyncMock(return_value={"id": "cus_tester"})
+
+        customer_id = async_to_sync(self.custom_billing.aget_or_create_stripe_customer)(stripe_module)
+
+        self.assertEqual(customer_id, "cus_tester")
+        self.custom_billing.refresh_from_db()
+        self.assertEqual(self.custom_billing.stripe_customer_id, "cus_tester")
+
+        # existing customer id is returned without calling Stripe again
+        async_to_sync(self.custom_billing.aget_or_create_stripe_customer)(stripe_module)
+        stripe_module.Customer.create_async.assert_awaited_once()
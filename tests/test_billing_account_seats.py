@@ -8,15 +8,10 @@ from drf_stripe.settings import drf_stripe_settings
 class TestDefaultMaxSubscriptionQuantity(TestCase):
     """Test DEFAULT_MAX_SUBSCRIPTION_QUANTITY setting behavior."""
 
-    def test_default_subscription_quantity_setting_exists(self):
-        """Verify the DEFAULT_MAX_SUBSCRIPTION_QUANTITY setting is accessible."""
+    def test_default_max_subscription_quantity(self):
+        """Verify the DEFAULT_MAX_SUBSCRIPTION_QUANTITY setting defaults to 1 and can be overridden."""
+        for user_settings, expected in (({}, 1), ({"DEFAULT_MAX_SUBSCRIPTION_QUANTITY": 5}, 5)):
+            with self.subTest(user_settings=user_settings), override_settings(DRF_STRIPE=user_settings):
+                # overriding DRF_STRIPE reloads drf_stripe_settings through the setting_changed signal
+                self.assertEqual(drf_stripe_settings.DEFAULT_MAX_SUBSCRIPTION_QUANTITY, expected)
         self.assertEqual(drf_stripe_settings.DEFAULT_MAX_SUBSCRIPTION_QUANTITY, 1)
-
-    @override_settings(DRF_STRIPE={"DEFAULT_MAX_SUBSCRIPTION_QUANTITY": 5})
-    def test_default_subscription_quantity_can_be_overridden(self):
-        """Verify the DEFAULT_MAX_SUBSCRIPTION_QUANTITY setting can be overridden."""
-        # Need to reload settings after override
-        drf_stripe_settings.reload()
-        self.assertEqual(drf_stripe_settings.DEFAULT_MAX_SUBSCRIPTION_QUANTITY, 5)
-        # Reload again to restore default
-        drf_stripe_settings.reload()
@@ -0,0 +1,104 @@
+"""Tests for the migrate_legacy_billing management command."""
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from drf_stripe.models import get_drf_stripe_user_model as get_user_model
+from drf_stripe.models import StripeUser, Subscription
+from tests.base import BaseTest
+from tests.models import CharGenericBilling, GenericBilling
+
+
+class TestMigrateLegacyBilling(BaseTest):
+
+    def setUp(self) -> None:
+        self.user, self.stripe_user = self.setup_user_customer()
+        self.user_2 = get_user_model().objects.create(username="tester2", email="tester2@example.com")
+        self.stripe_user_2 = StripeUser.objects.create(user_id=self.user_2.id, customer_id="cus_tester2")
+        Subscription.objects.create(subscription_id="sub_0001", stripe_user=self.stripe_user, status="active")
+        Subscription.objects.create(subscription_id="sub_0002", stripe_user=self.stripe_user_2, status="active")
+
+    def call_command(self, *args, billing_model="tests.GenericBilling"):
+        out = StringIO()
+        with override_settings(DRF_STRIPE={"BILLING_ACCOUNT_MODEL": billing_model}):
+            call_command("migrate_legacy_billing", *args, stdout=out)
+        return out.getvalue()
+
+    def test_migrate_creates_billing_accounts_and_moves_subscriptions(self):
+        user_ct = ContentType.objects.get_for_model(get_user_model())
+        existing = GenericBilling.objects.create(content_type=user_ct, object_id=self.user.pk)
+
+        self.call_command()
+
+        self.assertEqual(GenericBilling.objects.count(), 2)
+        created = GenericBilling.objects.get(content_type=user_ct, object_id=self.user_2.pk)
+        self.assertEqual(created.stripe_customer_id, "cus_tester2")
+
+        billing_ct = ContentType.objects.get_for_model(GenericBilling)
+        sub_1 = Subscription.objects.get(subscription_id="sub_0001")
+        self.assertEqual(sub_1.billing_account_content_type, billing_ct)
+        self.assertEqual(sub_1.billing_account_object_id, existing.pk)
+        sub_2 = Subscription.objects.get(subscription_id="sub_0002")
+        self.assertEqual(sub_2.billing_account_object_id, created.pk)
+
+    def test_migrate_is_idempotent(self):
+        self.assertIn("Created 2 BillingAccount(s), 0 already existed", self.call_command())
+        self.assertIn("Created 0 BillingAccount(s), 2 already existed", self.call_command())
+        self.assertEqual(GenericBilling.objects.count(), 2)
+
+    def test_migrate_use_copy_falls_back_to_bulk_create(self):
+        out = self.call_command("--use-copy")
+        self.assertIn("--use-copy is only supported on PostgreSQL", out)
+        self.assertEqual(GenericBilling.objects.count(), 2)
+
+    def test_migrate_use_copy_counts_copied_rows(self):
+        """The COPY path reports the rows COPY wrote instead of counting the BillingAccount table."""
+        command = "drf_stripe.management.commands.migrate_legacy_billing"
+        with patch(f"{command}.connection.vendor", "postgresql"), \
+                patch(f"{command}.Command._copy_billing_accounts", side_effect=lambda model, rows: len(rows)), \
+                CaptureQueriesContext(connection) as queries:
+            out = self.call_command("--use-copy")
+
+        self.assertIn("Created 2 BillingAccount(s)", out)
+        self.assertFalse([query["sql"] for query in queries.captured_queries if "COUNT(" in query["sql"]])
+
+    def test_migrate_fills_missing_stripe_customer_id(self):
+        user_ct = ContentType.objects.get_for_model(get_user_model())
+        existing = GenericBilling.objects.create(content_type=user_ct, object_id=self.user.pk)
+
+        self.call_command()
+
+        existing.refresh_from_db()
+        self.assertEqual(existing.stripe_customer_id, "cus_tester")
+
+    def test_migrate_reports_subscriptions_with_verbosity(self):
+        self.assertNotIn("Moving Subscription", self.call_command())
+        out = self.call_command("--verbosity", "2")
+        self.assertIn("Moving Subscription sub_0001", out)
+
+    def test_migrate_char_object_id(self):
+        """User ids are matched to BillingAccounts whose object_id is a CharField."""
+        self.call_command(billing_model="tests.CharGenericBilling")
+        out = self.call_command(billing_model="tests.CharGenericBilling")
+
+        self.assertIn("Created 0 BillingAccount(s), 2 already existed", out)
+        self.assertEqual(CharGenericBilling.objects.count(), 2)
+        billing = CharGenericBilling.objects.get(object_id=str(self.user_2.pk))
+        sub_2 = Subscription.objects.get(subscription_id="sub_0002")
+        self.assertEqual(sub_2.billing_account_object_id, billing.pk)
+
+    def test_migrate_reports_failed_chunks(self):
+        with patch(
+            "drf_stripe.management.commands.migrate_legacy_billing.Command._write_billing_accounts",
+            side_effect=ValueError("boom")
+        ):
+            out = self.call_command()
+
+        self.assertIn(f"Failed migrating users {self.user.pk} to {self.user_2.pk}: boom", out)
+        self.assertIn("Moved 0 Subscription(s)", out)
+        self.assertEqual(GenericBilling.objects.count(), 0)
@@ -0,0 +1,15 @@
+from django.test import TestCase, override_settings
+
+from drf_stripe.settings import drf_stripe_settings
+
+
+class TestDrfStripeSettings(TestCase):
+
+    def test_checkout_urls(self):
+        self.assertEqual(drf_stripe_settings.CHECKOUT_SUCCESS_URL, "http://localhost:3000/payment")
+        self.assertEqual(drf_stripe_settings.CHECKOUT_CANCEL_URL, "http://localhost:3000/manage-subscription")
+
+    def test_checkout_urls_follow_settings_changes(self):
+        with override_settings(DRF_STRIPE={"FRONT_END_BASE_URL": "https://example.com"}):
+            self.assertEqual(drf_stripe_settings.CHECKOUT_SUCCESS_URL, "https://example.com/payment")
+        self.assertEqual(drf_stripe_settings.CHECKOUT_SUCCESS_URL, "http://localhost:3000/payment")
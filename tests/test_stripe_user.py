@@ -0,0 +1,48 @@
+from drf_stripe.models import Subscription, SubscriptionItem
+from drf_stripe.stripe_api.customers import get_or_create_stripe_user
+from .base import BaseTest
+
+
+class TestStripeUserSubscribed(BaseTest):
+
+    def setUp(self) -> None:
+        self.setup_product_prices()
+        self.user, self.stripe_user = self.setup_user_customer()
+
+    def create_subscription(self, subscription_id, status, price_id):
+        subscription = Subscription.objects.create(
+            subscription_id=subscription_id, stripe_user=self.stripe_user, status=status
+        )
+        SubscriptionItem.objects.create(
+            sub_item_id=f"si_{subscription_id}", subscription=subscription, price_id=price_id, quantity=1
+        )
+
+    def test_subscribed_features(self):
+        self.create_subscription("sub_0001", "active", "price_1KHkCLL14ex1CGCipzcBdnOp")
+        self.create_subscription("sub_0002", "canceled", "price_1KHkoTL14ex1CGCiV8X4cJs5")
+
+        with self.assertNumQueries(1):
+            features = self.stripe_user.subscribed_features
+        self.assertEqual({feature.feature_id for feature in features}, {"A", "B", "D"})
+
+    def test_subscribed_products(self):
+        self.create_subscription("sub_0001", "active", "price_1KHkCLL14ex1CGCipzcBdnOp")
+        self.create_subscription("sub_0002", "trialing", "price_1KHkCLL14ex1CGCieIBu8V2e")
+        self.create_subscription("sub_0003", "canceled", "price_1KHkoTL14ex1CGCiV8X4cJs5")
+
+        with self.assertNumQueries(1):
+            products = self.stripe_user.subscribed_products
+        self.assertEqual({product.product_id for product in products}, {"prod_KxfXRXOd7dnLbz"})
+
+
+class TestGetOrCreateStripeUser(BaseTest):
+
+    def setUp(self) -> None:
+        self.user, self.stripe_user = self.setup_user_customer()
+
+    def test_get_existing_stripe_user_from_customer_id(self):
+        # savepoint, select, release savepoint
+        with self.assertNumQueries(3):
+            stripe_user = get_or_create_stripe_user(customer_id="cus_tester")
+        self.assertEqual(stripe_user, self.stripe_user)
+        self.assertEqual(stripe_user.user_id, self.user.id)
@@ -0,0 +1,66 @@
+from django.contrib.contenttypes.models import ContentType
+
+from drf_stripe.models import Subscription
+from drf_stripe.stripe_api.subscriptions import prefetch_billing_accounts
+from tests.models import CustomBilling
+from .base import BaseTest
+
+
+class TestSubscriptionOwner(BaseTest):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.custom_billing_ct = ContentType.objects.get_for_model(CustomBilling)
+
+    def setUp(self) -> None:
+        self.user, self.stripe_user = self.setup_user_customer()
+        self.custom_billing = CustomBilling.objects.create(name="Test CustomBilling", manager_user=self.user)
+
+    def test_get_owner_returns_billing_account(self):
+        Subscription.objects.create(
+            subscription_id="sub_0001", stripe_user=self.stripe_user, status="active",
+            billing_account_content_type=self.custom_billing_ct,
+            billing_account_object_id=self.custom_billing.pk
+        )
+        subscription = Subscription.objects.select_related("billing_account_content_type").get(
+            subscription_id="sub_0001"
+        )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(subscription.billing_account, self.custom_billing)
+            self.assertEqual(subscription.get_owner(), self.custom_billing)
+
+    def test_get_owner_falls_back_to_user(self):
+        subscription = Subscription.objects.create(
+            subscription_id="sub_0001", stripe_user=self.stripe_user, status="active"
+        )
+        self.assertIsNone(subscription.billing_account)
+        self.assertEqual(subscription.get_owner(), self.user)
+
+    def test_prefetch_billing_accounts(self):
+        other_billing = CustomBilling.objects.create(name="Other CustomBilling")
+        for i, billing in enumerate((self.custom_billing, other_billing, self.custom_billing)):
+            Subscription.objects.create(
+                subscription_id=f"sub_000{i}", stripe_user=self.stripe_user, status="active",
+                billing_account_content_type=self.custom_billing_ct, billing_account_object_id=billing.pk
+            )
+        Subscription.objects.create(subscription_id="sub_legacy", stripe_user=self.stripe_user, status="active")
+
+        # one query for the subscriptions, one for the CustomBilling rows
+        with self.assertNumQueries(2):
+            subscriptions = prefetch_billing_accounts(Subscription.objects.order_by("subscription_id"))
+            owners = [sub.billing_account for sub in subscriptions]
+
+        self.assertEqual(owners, [self.custom_billing, other_billing, self.custom_billing, None])
+
+    def test_prefetch_related_billing_account(self):
+        for i in range(3):
+            Subscription.objects.create(
+                subscription_id=f"sub_000{i}", stripe_user=self.stripe_user, status="active",
+                billing_account_content_type=self.custom_billing_ct, billing_account_object_id=self.custom_billing.pk
+            )
+
+        with self.assertNumQueries(2):
+            owners = [sub.get_owner() for sub in Subscription.objects.prefetch_related("billing_account")]
+
+        self.assertEqual(owners, [self.custom_billing] * 3)
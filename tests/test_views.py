@@ -0,0 +1,82 @@
+from unittest.mock import patch
+
+from rest_framework.test import APIClient
+
+from drf_stripe.models import Subscription, SubscriptionItem
+from drf_stripe.stripe_api.subscriptions import list_subscribable_product_prices_to_user, \
+    list_user_subscription_products
+from .base import BaseTest
+
+
+class TestViews(BaseTest):
+
+    def setUp(self) -> None:
+        self.setup_product_prices()
+        self.user, self.stripe_user = self.setup_user_customer()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_subscription(self, subscription_id, status, price_id):
+        subscription = Subscription.objects.create(
+            subscription_id=subscription_id, stripe_user=self.stripe_user, status=status
+        )
+        SubscriptionItem.objects.create(
+            sub_item_id=f"si_{subscription_id}", subscription=subscription, price_id=price_id, quantity=1
+        )
+
+    def test_my_subscription_items(self):
+        self.create_subscription("sub_0001", "active", "price_1KHkCLL14ex1CGCipzcBdnOp")
+        self.create_subscription("sub_0002", "trialing", "price_1KHkoTL14ex1CGCiV8X4cJs5")
+
+        # one query for the items joined to subscription/price/product, one for the prefetched features
+        with self.assertNumQueries(2):
+            response = self.client.get("/stripe/my-subscription-items/")
+
+        self.assertEqual(response.status_code, 200)
+        items = {item["price_id"]: item for item in response.json()}
+        self.assertEqual(set(items), {"price_1KHkCLL14ex1CGCipzcBdnOp", "price_1KHkoTL14ex1CGCiV8X4cJs5"})
+        self.assertEqual(
+            {service["feature_id"] for service in items["price_1KHkoTL14ex1CGCiV8X4cJs5"]["services"]},
+            {"A", "B", "C"}
+        )
+
+    def test_subscribable_product_excludes_subscribed_products(self):
+        self.create_subscription("sub_0001", "active", "price_1KHkCLL14ex1CGCipzcBdnOp")
+
+        response = self.client.get("/stripe/subscribable-product/")
+
+        self.assertEqual(response.status_code, 200)
+        prices = response.json()
+        self.assertEqual({price["product_id"] for price in prices}, {"prod_KxgA5goLUMwnoN"})
+        self.assertEqual({service["feature_id"] for service in prices[0]["services"]}, {"A", "B", "C"})
+
+    def test_list_subscribable_product_prices_is_single_query(self):
+        self.create_subscription("sub_0001", "active", "price_1KHkCLL14ex1CGCipzcBdnOp")
+
+        with self.assertNumQueries(1):
+            prices = list(list_subscribable_product_prices_to_user(self.user.id))
+
+        self.assertEqual({price.product_id for price in prices}, {"prod_KxgA5goLUMwnoN"})
+
+    def test_list_user_subscription_products(self):
+        self.create_subscription("sub_0001", "active", "price_1KHkCLL14ex1CGCipzcBdnOp")
+        self.create_subscription("sub_0002", "canceled", "price_1KHkoTL14ex1CGCiV8X4cJs5")
+
+        with self.assertNumQueries(1):
+            current_products = {product.product_id for product in list_user_subscription_products(self.user.id)}
+        self.assertEqual(current_products, {"prod_KxfXRXOd7dnLbz"})
+
+        all_products = list_user_subscription_products(self.user.id, current=False)
+        self.assertEqual({product.product_id for product in all_products}, {"prod_KxfXRXOd7dnLbz", "prod_KxgA5goLUMwnoN"})
+
+    @patch("drf_stripe.serializers.stripe_api_create_checkout_session")
+    def test_checkout(self, mock_create_checkout_session):
+        mock_create_checkout_session.return_value = {"id": "cs_test"}
+
+        response = self.client.post("/stripe/checkout/", {"price_id": "price_1KHkCLL14ex1CGCipzcBdnOp"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"session_id": "cs_test"})
+        mock_create_checkout_session.assert_called_once_with(
+            customer_id="cus_tester", price_id="price_1KHkCLL14ex1CGCipzcBdnOp"
+        )
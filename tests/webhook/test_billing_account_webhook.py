@@ -1,41 +1,39 @@
 """Tests for webhook billing account integration."""
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
-from drf_stripe.models import Subscription, SubscriptionItem, StripeUser
-from drf_stripe.settings import drf_stripe_settings
-from drf_stripe.stripe_webhooks.handler import handle_webhook_event
+from drf_stripe.models import Subscription, StripeUser
+from drf_stripe.stripe_webhooks.handler import handle_webhook_event, handle_webhook_events
 from tests.base import BaseTest
+from tests.mixins import BillingAccountTestMixin
 from tests.models import CustomBilling
 
 
-class TestWebhookBillingAccountIntegration(BaseTest):
+class TestWebhookBillingAccountIntegration(BillingAccountTestMixin, BaseTest):
     """Test that webhook handlers integrate with billing account correctly."""
 
-    def setUp(self) -> None:
-        self.setup_product_prices()
+    @classmethod
+    def setUpTestData(cls):
+        cls.setup_product_prices()
         # Create a user and a custom billing account with that user as manager
-        self.user = get_user_model().objects.create(
+        cls.user = get_user_model().objects.create(
             username="tester",
             email="tester1@example.com",
             password="12345"
         )
-        self.custom_billing = CustomBilling.objects.create(
+        cls.custom_billing = CustomBilling.objects.create(
             name="Test CustomBilling",
-            manager_user=self.user
+            manager_user=cls.user
         )
         # Create StripeUser for the test user
-        self.stripe_user = StripeUser.objects.create(
-            user_id=self.user.id,
+        cls.stripe_user = StripeUser.objects.create(
+            user_id=cls.user.id,
             customer_id="cus_tester"
         )
-
-    def get_billing_settings(self):
-        """Return DRF_STRIPE settings with BILLING_ACCOUNT_MODEL configured."""
-        settings_copy = dict(drf_stripe_settings.user_settings)
-        settings_copy['BILLING_ACCOUNT_MODEL'] = 'tests.CustomBilling'
-        return settings_copy
+        cls.custom_billing_ct = ContentType.objects.get_for_model(CustomBilling)
 
     def test_webhook_subscription_created_links_to_billing_account(self):
         """
@@ -43,26 +41,78 @@ class TestWebhookBillingAccountIntegration(BaseTest):
         when BILLING_ACCOUNT_MODEL is configured.
         """
         with override_settings(DRF_STRIPE=self.get_billing_settings()):
-            drf_stripe_settings.reload()
-
             event = self._load_test_data("2020-08-27/webhook_subscription_created.json")
-            handle_webhook_event(event)
+            # StripeUser lock, billing account lookup by customer id then manager user, billing account UPDATE,
+            # Subscription UPDATE then INSERT, SubscriptionItem SELECT and INSERT, plus 4 savepoint statements
+            with self.assertNumQueries(12):
+                handle_webhook_event(event)
 
             # Check subscription was created and linked to billing account
-            subscription = Subscription.objects.get(subscription_id="sub_1KHlYHL14ex1CGCiIBo8Xk5p")
-            self.assertEqual(subscription.stripe_user.customer_id, "cus_tester")
+            subscription = Subscription.objects.filter(subscription_id="sub_1KHlYHL14ex1CGCiIBo8Xk5p").values(
+                "stripe_user__customer_id", "billing_account_content_type_id", "billing_account_object_id"
+            ).get()
+            self.assertEqual(subscription["stripe_user__customer_id"], "cus_tester")
 
             # Check billing account content type and object id are set
-            custom_billing_ct = ContentType.objects.get_for_model(CustomBilling)
-            self.assertEqual(subscription.billing_account_content_type, custom_billing_ct)
-            self.assertEqual(subscription.billing_account_object_id, self.custom_billing.pk)
+            self.assertEqual(subscription["billing_account_content_type_id"], self.custom_billing_ct.pk)
+            self.assertEqual(subscription["billing_account_object_id"], self.custom_billing.pk)
 
             # Check billing account fields are updated
-            self.custom_billing.refresh_from_db()
-            self.assertEqual(self.custom_billing.stripe_customer_id, "cus_tester")
-            self.assertEqual(self.custom_billing.stripe_subscription_id, "sub_1KHlYHL14ex1CGCiIBo8Xk5p")
+            self.assertEqual(self.get_billing_stripe_ids(), ("cus_tester", "sub_1KHlYHL14ex1CGCiIBo8Xk5p"))
+
+    def test_webhook_subscription_does_not_load_user(self):
+        """
+        Test that the billing account is found by the StripeUser's user id, without querying the user table.
+        """
+        user_table = get_user_model()._meta.db_table
+        with override_settings(DRF_STRIPE=self.get_billing_settings()):
+            event = self._load_test_data("2020-08-27/webhook_subscription_created.json")
+            with CaptureQueriesContext(connection) as queries:
+                handle_webhook_event(event)
+
+        self.assertFalse([query["sql"] for query in queries.captured_queries if f'"{user_table}"' in query["sql"]])
+        self.assertEqual(self.get_billing_stripe_ids()[1], "sub_1KHlYHL14ex1CGCiIBo8Xk5p")
+
+    def test_webhook_subscription_reuses_billing_content_type(self):
+        """
+        Test that repeated events link subscriptions to the billing account without querying ContentType again.
+        """
+        content_type_table = ContentType._meta.db_table
+        with override_settings(DRF_STRIPE=self.get_billing_settings()):
+            event = self._load_test_data("2020-08-27/webhook_subscription_created.json")
+            handle_webhook_event(event)
+            with CaptureQueriesContext(connection) as queries:
+                handle_webhook_event(event)
+
+        self.assertFalse([query["sql"] for query in queries.captured_queries if f'"{content_type_table}"' in query["sql"]])
+        subscription = Subscription.objects.get(subscription_id="sub_1KHlYHL14ex1CGCiIBo8Xk5p")
+        self.assertEqual(subscription.billing_account_content_type_id, self.custom_billing_ct.pk)
+
+    def test_webhook_events_batch_saves_billing_account_once(self):
+        """
+        Test that a batch of events for one customer loads its StripeUser and updates its billing account once.
+        """
+        first_event = self._load_test_data("2020-08-27/webhook_subscription_created.json")
+        second_event = self._load_test_data("2020-08-27/webhook_subscription_created.json")
+        second_event["data"]["object"]["id"] = "sub_0002"
+        for item in second_event["data"]["object"]["items"]["data"]:
+            item["id"] = f"{item['id']}_2"
+
+        billing_table = CustomBilling._meta.db_table
+        with override_settings(DRF_STRIPE=self.get_billing_settings()):
+            with CaptureQueriesContext(connection) as queries:
+                handle_webhook_events([first_event, second_event])
 
-            drf_stripe_settings.reload()
+        billing_writes = [query["sql"] for query in queries.captured_queries if query["sql"].startswith(f'UPDATE "{billing_table}"')]
+        self.assertEqual(len(billing_writes), 1)
+        stripe_user_table = StripeUser._meta.db_table
+        stripe_user_queries = [query["sql"] for query in queries.captured_queries if f'FROM "{stripe_user_table}"' in query["sql"]]
+        self.assertEqual(len(stripe_user_queries), 1)
+        self.assertEqual(self.get_billing_stripe_ids(), ("cus_tester", "sub_0002"))
+        self.assertEqual(
+            set(Subscription.objects.values_list("subscription_id", "billing_account_object_id")),
+            {("sub_1KHlYHL14ex1CGCiIBo8Xk5p", self.custom_billing.pk), ("sub_0002", self.custom_billing.pk)}
+        )
 
     def test_webhook_subscription_without_billing_model_works_as_before(self):
         """
@@ -72,14 +122,14 @@ class TestWebhookBillingAccountIntegration(BaseTest):
         handle_webhook_event(event)
 
         # Check subscription was created
-        subscription = Subscription.objects.get(subscription_id="sub_1KHlYHL14ex1CGCiIBo8Xk5p")
-        self.assertEqual(subscription.stripe_user.customer_id, "cus_tester")
+        subscription = Subscription.objects.filter(subscription_id="sub_1KHlYHL14ex1CGCiIBo8Xk5p").values(
+            "stripe_user__customer_id", "billing_account_content_type_id", "billing_account_object_id"
+        ).get()
+        self.assertEqual(subscription["stripe_user__customer_id"], "cus_tester")
 
         # Check billing account fields are NOT set (legacy behavior)
-        self.assertIsNone(subscription.billing_account_content_type)
-        self.assertIsNone(subscription.billing_account_object_id)
+        self.assertIsNone(subscription["billing_account_content_type_id"])
+        self.assertIsNone(subscription["billing_account_object_id"])
 
         # CustomBilling should not be updated
-        self.custom_billing.refresh_from_db()
-        self.assertIsNone(self.custom_billing.stripe_customer_id)
-        self.assertIsNone(self.custom_billing.stripe_subscription_id)
+        self.assertEqual(self.get_billing_stripe_ids(), (None, None))
@@ -0,0 +1,170 @@
+"""Tests for the billing account webhook view."""
+import json
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.test import RequestFactory, override_settings
+
+from drf_stripe.stripe_webhooks.billing import stripe_webhook, map_billing_account, MAX_SIGNATURE_HEADER_LENGTH
+from tests.base import BaseTest
+from tests.models import CustomBilling, GenericBilling, OwnedBilling
+
+SIGNATURE_HEADER = "t=1492774577,v1=5257a869e7ecebeda32affa62cdca3fa51cad7e77a0e56ff536d0ce8e108d8bd"
+
+# data dicts received by queue_billing_task, the BILLING_WEBHOOK_TASK used in tests
+queued_billing_data = []
+
+
+def queue_billing_task(data):
+    queued_billing_data.append(data)
+
+
+def make_checkout_event(metadata=None):
+    return {
+        "type": "checkout.session.completed",
+        "data": {"object": {"subscription": "sub_0001", "customer": "cus_tester", "metadata": metadata or {}}}
+    }
+
+
+def post_billing_webhook(sig_header=SIGNATURE_HEADER):
+    request = RequestFactory().post(
+        "/stripe/billing-webhook/", data=b"{}", content_type="application/json", HTTP_STRIPE_SIGNATURE=sig_header
+    )
+    return stripe_webhook(request)
+
+
+class TestBillingWebhookSignatureHeader(BaseTest):
+    """Test that malformed Stripe-Signature headers are rejected before the signature is verified."""
+
+    def post(self, sig_header):
+        return post_billing_webhook(sig_header)
+
+    @patch("stripe.Webhook.construct_event")
+    def test_oversized_header_is_rejected(self, mock_construct_event):
+        sig_header = "t=1492774577," + "v1=" + "a" * MAX_SIGNATURE_HEADER_LENGTH
+        self.assertEqual(self.post(sig_header).status_code, 400)
+        mock_construct_event.assert_not_called()
+
+    @patch("stripe.Webhook.construct_event")
+    def test_header_without_timestamp_or_signature_is_rejected(self, mock_construct_event):
+        for sig_header in ("", "v1=5257a869e7ecebeda32affa62cdca3fa51cad7e77a0e56ff536d0ce8e108d8bd", "t=1492774577"):
+            with self.subTest(sig_header=sig_header):
+                self.assertEqual(self.post(sig_header).status_code, 400)
+        mock_construct_event.assert_not_called()
+
+    @patch("stripe.Webhook.construct_event")
+    def test_header_with_several_signatures_is_verified(self, mock_construct_event):
+        """Stripe sends one v1 signature per secret while a webhook secret is rolled."""
+        mock_construct_event.return_value = {"type": "customer.created", "data": {"object": {}}}
+        sig_header = "t=1492774577,v1=5257a869e7ecebeda32affa62cdca3fa51cad7e77a0e56ff536d0ce8e108d8bd," \
+                     "v1=6ffbb59b2300aae63f272406069a9788598b792a944a07aba816edb039989a39,v0=6ffbb59b2300aae63f27"
+
+        self.assertEqual(self.post(sig_header).status_code, 200)
+        mock_construct_event.assert_called_once_with(b"{}", sig_header, "whsec_1234567890")
+
+
+@patch("stripe.Webhook.construct_event")
+class TestBillingWebhookMapping(BaseTest):
+    """Test that billing webhook events are mapped to billing accounts, inline or by BILLING_WEBHOOK_TASK."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username="tester", email="tester1@example.com")
+        cls.owned_billing = OwnedBilling.objects.create(owner=cls.user)
+        cls.custom_billing = CustomBilling.objects.create(
+            name="Test CustomBilling", manager_user=cls.user, stripe_customer_id="cus_tester"
+        )
+
+    def setUp(self) -> None:
+        queued_billing_data.clear()
+
+    def test_billing_webhook_task_receives_data(self, mock_construct_event):
+        mock_construct_event.return_value = make_checkout_event({"owner_type": "auth.User", "owner_id": "1"})
+
+        with override_settings(DRF_STRIPE={
+            "BILLING_ACCOUNT_MODEL": "tests.CustomBilling",
+            "BILLING_WEBHOOK_TASK": "tests.webhook.test_billing_webhook.queue_billing_task",
+        }):
+            with self.assertNumQueries(0):
+                response = post_billing_webhook()
+
+        self.assertEqual(response.status_code, 200)
+        expected = {"owner_type": "auth.User", "owner_id": "1", "subscription_id": "sub_0001", "customer_id": "cus_tester"}
+        self.assertEqual(queued_billing_data, [expected])
+        self.assertEqual(json.loads(json.dumps(queued_billing_data[0])), expected)
+        self.custom_billing.refresh_from_db()
+        self.assertIsNone(self.custom_billing.stripe_subscription_id)
+
+    def test_billing_account_mapped_by_owner_metadata(self, mock_construct_event):
+        mock_construct_event.return_value = make_checkout_event({"owner_type": "auth.User", "owner_id": str(self.user.pk)})
+
+        with override_settings(DRF_STRIPE={"BILLING_ACCOUNT_MODEL": "tests.OwnedBilling"}):
+            response = post_billing_webhook()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queued_billing_data, [])
+        self.owned_billing.refresh_from_db()
+        self.assertEqual(self.owned_billing.stripe_subscription_id, "sub_0001")
+
+    def test_billing_account_mapped_by_customer_id(self, mock_construct_event):
+        mock_construct_event.return_value = make_checkout_event()
+
+        with override_settings(DRF_STRIPE={"BILLING_ACCOUNT_MODEL": "tests.CustomBilling"}):
+            response = post_billing_webhook()
+
+        self.assertEqual(response.status_code, 200)
+        self.custom_billing.refresh_from_db()
+        self.assertEqual(self.custom_billing.stripe_subscription_id, "sub_0001")
+
+
+class TestMapBillingAccount(BaseTest):
+    """Test that map_billing_account loads only the subscription id column and saves it with a single UPDATE."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create(username="tester", email="tester1@example.com")
+        cls.data = {"owner_type": "auth.User", "owner_id": str(cls.user.pk), "subscription_id": "sub_0001", "customer_id": None}
+
+    def map_billing_account(self, billing_model_path, data, num_queries):
+        with override_settings(DRF_STRIPE={"BILLING_ACCOUNT_MODEL": billing_model_path}):
+            with self.assertNumQueries(num_queries):
+                map_billing_account(data)
+
+    def test_generic_owner(self):
+        billing = GenericBilling.objects.create(content_type=ContentType.objects.get_for_model(self.user), object_id=self.user.pk)
+
+        # owner exists() check, billing account lookup, UPDATE
+        self.map_billing_account("tests.GenericBilling", self.data, 3)
+
+        billing.refresh_from_db()
+        self.assertEqual(billing.stripe_subscription_id, "sub_0001")
+
+    def test_owner_foreign_key(self):
+        billing = OwnedBilling.objects.create(owner=self.user)
+
+        # billing account lookup, UPDATE
+        self.map_billing_account("tests.OwnedBilling", self.data, 2)
+
+        billing.refresh_from_db()
+        self.assertEqual(billing.stripe_subscription_id, "sub_0001")
+
+    def test_customer_id(self):
+        billing = CustomBilling.objects.create(name="Test CustomBilling", stripe_customer_id="cus_tester")
+        data = {"owner_type": None, "owner_id": None, "subscription_id": "sub_0001", "customer_id": "cus_tester"}
+
+        # billing account lookup, UPDATE
+        self.map_billing_account("tests.CustomBilling", data, 2)
+
+        billing.refresh_from_db()
+        self.assertEqual(billing.stripe_subscription_id, "sub_0001")
+
+    def test_save_error_is_logged(self):
+        CustomBilling.objects.create(name="Test CustomBilling", stripe_customer_id="cus_tester")
+        data = {"owner_type": None, "owner_id": None, "subscription_id": "sub_0001", "customer_id": "cus_tester"}
+
+        with patch.object(CustomBilling, "save", side_effect=ValueError("boom")), \
+                self.assertLogs("drf_stripe.stripe_webhooks.billing", level="ERROR") as logs:
+            self.map_billing_account("tests.CustomBilling", data, 1)
+
+        self.assertIn("Could not save subscription id sub_0001", logs.output[0])
@@ -1,5 +1,8 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
 from drf_stripe.models import Subscription, SubscriptionItem
-from drf_stripe.stripe_webhooks.handler import handle_webhook_event
+from drf_stripe.stripe_webhooks.handler import handle_webhook_event, handle_webhook_events
 from ..base import BaseTest
 
 
@@ -17,7 +20,9 @@ class TestWebhookSubscriptionEvents(BaseTest):
     def test_event_handler_subscription_created(self):
         """Mock customer subscription creation event"""
 
-        self.create_subscription()
+        # StripeUser lock, Subscription UPDATE then INSERT, SubscriptionItem SELECT and INSERT, plus 4 savepoint statements
+        with self.assertNumQueries(9):
+            self.create_subscription()
 
         # check subscription instance is created
         subscription = Subscription.objects.get(subscription_id="sub_1KHlYHL14ex1CGCiIBo8Xk5p")
@@ -48,6 +53,81 @@ class TestWebhookSubscriptionEvents(BaseTest):
         sub_item = SubscriptionItem.objects.get(price_id="price_1KHkCLL14ex1CGCieIBu8V2e")
         self.assertEqual(sub_item.subscription.subscription_id, subscription.subscription_id)
 
+    def test_event_handler_subscription_updated_items_unchanged(self):
+        """Subscription items are not rewritten when an event does not change them"""
+        self.create_subscription()
+        sub_item_ids = set(SubscriptionItem.objects.values_list("sub_item_id", flat=True))
+
+        event = self._load_test_data("2020-08-27/webhook_subscription_created.json")
+        with CaptureQueriesContext(connection) as queries:
+            handle_webhook_event(event)
+
+        self.assertEqual(set(SubscriptionItem.objects.values_list("sub_item_id", flat=True)), sub_item_ids)
+        item_writes = [
+            query["sql"] for query in queries.captured_queries
+            if "drf_stripe_subscriptionitem" in query["sql"] and not query["sql"].startswith("SELECT")
+        ]
+        self.assertEqual(item_writes, [])
+
+    def test_event_handler_loads_only_stripe_user_id(self):
+        """Only the StripeUser primary key is selected when handling a subscription event"""
+        event = self._load_test_data("2020-08-27/webhook_subscription_created.json")
+        with CaptureQueriesContext(connection) as queries:
+            handle_webhook_event(event)
+
+        stripe_user_columns = [
+            query["sql"].split(" FROM ")[0] for query in queries.captured_queries
+            if 'FROM "drf_stripe_stripeuser"' in query["sql"]
+        ]
+        self.assertEqual(stripe_user_columns, ['SELECT "drf_stripe_stripeuser"."user_id"'])
+
+    def test_handle_webhook_events_applies_last_event_per_subscription(self):
+        """A batch of events for one subscription is applied once, with the state of the last event"""
+        events = [
+            self._load_test_data(f"2020-08-27/{file_name}.json") for file_name in (
+                "webhook_subscription_created",
+                "webhook_subscription_updated_billing_frequency",
+                "webhook_subscription_updated_cancel_immediate",
+            )
+        ]
+
+        with CaptureQueriesContext(connection) as queries:
+            handle_webhook_events(events)
+
+        subscription = Subscription.objects.get(subscription_id="sub_1KHlYHL14ex1CGCiIBo8Xk5p")
+        self.assertEqual(subscription.status, "canceled")
+        # a single UPDATE, matching no row, then the INSERT
+        subscription_writes = [
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith(('UPDATE "drf_stripe_subscription"', 'INSERT INTO "drf_stripe_subscription"'))
+        ]
+        self.assertEqual(len(subscription_writes), 2)
+
+    def test_handle_webhook_events_applies_newest_event_out_of_order(self):
+        """The event with the greatest created timestamp wins, whatever its position in the batch"""
+        events = [
+            self._load_test_data(f"2020-08-27/{file_name}.json") for file_name in (
+                "webhook_subscription_updated_cancel_immediate",
+                "webhook_subscription_created",
+            )
+        ]
+
+        self.assertEqual(handle_webhook_events(events), [])
+
+        subscription = Subscription.objects.get(subscription_id="sub_1KHlYHL14ex1CGCiIBo8Xk5p")
+        self.assertEqual(subscription.status, "canceled")
+
+    def test_handle_webhook_events_returns_events_of_unknown_customers(self):
+        """An event for a customer without StripeUser is returned and does not roll back the batch"""
+        event = self._load_test_data("2020-08-27/webhook_subscription_created.json")
+        unknown_event = self._load_test_data("2020-08-27/webhook_subscription_created.json")
+        unknown_event["data"]["object"]["id"] = "sub_unknown"
+        unknown_event["data"]["object"]["customer"] = "cus_unknown"
+
+        self.assertEqual(handle_webhook_events([unknown_event, event]), [unknown_event])
+
+        self.assertEqual(list(Subscription.objects.values_list("subscription_id", flat=True)), ["sub_1KHlYHL14ex1CGCiIBo8Xk5p"])
+
     def test_event_handler_subscription_updated_coupon_added(self):
         self.create_subscription()
 